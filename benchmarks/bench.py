@@ -0,0 +1,138 @@
+# benchmarks/bench.py
+# Tiempos por etapa del análisis sobre las placas de samples/ y placas sintéticas
+#
+#   python -m benchmarks.bench --scales 10 100 1000 --json bench.json
+#   python -m benchmarks.bench --compare bench.json      # falla si hay regresiones
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from pcr_ct import apply_ct_calls
+from pcr_core import RunAnalysis, conversion_factors, fit_standards, read_run, split_tasks, summarize_patients
+from pcr_export import export_run
+from pcr_reader import read_amplification
+
+from benchmarks.synth import synthesize_amplification, synthesize_plate, write_text_export
+
+SAMPLES_DIR = Path(__file__).resolve().parent.parent / "samples"
+# Pacientes y dianas de una placa real típica (p. ej. samples/20250624 P190 P210.xls)
+BASE_PATIENTS = 10
+BASE_TARGETS = 2
+
+
+def _timed(fn, repeat):
+    times, result = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times) * 1000, result
+
+
+def bench_plate(data, repeat=5, multiplicador=100):
+    """Mediana en ms de cada etapa para el contenido de un export."""
+    stages = {}
+    stages["parse"], df = _timed(lambda: read_run(data), repeat)
+    try:
+        amp = read_amplification(data)
+    except ValueError:
+        # Las placas de samples/ no traen datos de amplificación
+        stages["ct"] = 0.0
+    else:
+        stages["ct"], _ = _timed(lambda: apply_ct_calls(df, amp), repeat)
+    stages["split"], (df_patients, df_standard) = _timed(lambda: split_tasks(df), repeat)
+    stages["fit"], (regression_dict, pair_factors_dict, warnings) = _timed(lambda: fit_standards(df_standard), repeat)
+    stages["factors"], _ = _timed(
+        lambda: conversion_factors(df_patients["Target Name"], df_patients["Quantity Mean"], pair_factors_dict),
+        repeat,
+    )
+    stages["summary"], (summary_df, summary_ct_df) = _timed(
+        lambda: summarize_patients(df_patients, pair_factors_dict, multiplicador), repeat
+    )
+
+    run = RunAnalysis(df_patients, df_standard, regression_dict, pair_factors_dict, warnings)
+    stages["export"], _ = _timed(lambda: export_run(run, summary_df, summary_ct_df), repeat)
+    stages["total"] = sum(stages.values())
+    return {"wells": len(df), "stages": stages}
+
+
+def collect_plates(scales, targets, workdir, target_scales=()):
+    """Placas reales de samples/ y sintéticas escaladas (nombre -> bytes).
+
+    `scales` multiplica los pacientes y `target_scales` las dianas (con los
+    pacientes de la placa base), para medir también los costes por target.
+    """
+    plates = {p.name: p.read_bytes() for p in sorted(SAMPLES_DIR.glob("*.xls"))}
+    base_targets = targets or BASE_TARGETS
+    synthetic = [(f"synth x{k}", BASE_PATIENTS * k, base_targets, k) for k in scales]
+    synthetic += [(f"synth dianas x{k}", BASE_PATIENTS, base_targets * k, 1000 + k) for k in target_scales]
+    for name, n_patients, n_targets, seed in synthetic:
+        path = Path(workdir) / f"{name.replace(' ', '_')}.txt"
+        plate = synthesize_plate(n_patients, n_targets, seed=seed)
+        write_text_export(plate, path, synthesize_amplification(plate, seed=seed))
+        plates[name] = path.read_bytes()
+    return plates
+
+
+def print_report(results, budget_ms):
+    stages = list(next(iter(results.values()))["stages"])
+    print(f"{'plate':<28}{'wells':>8}" + "".join(f"{s:>10}" for s in stages))
+    for name, res in results.items():
+        row = f"{name:<28}{res['wells']:>8}" + "".join(f"{res['stages'][s]:>10.1f}" for s in stages)
+        if res["stages"]["total"] > budget_ms:
+            row += "  > presupuesto"
+        print(row)
+
+
+def compare(results, baseline, threshold):
+    """Etapas más lentas que `threshold` veces la referencia guardada."""
+    regressions = []
+    for name, res in results.items():
+        ref = baseline.get(name)
+        if ref is None:
+            continue
+        for stage, ms in res["stages"].items():
+            ref_ms = ref["stages"].get(stage)
+            # Por debajo de 1 ms el ruido domina
+            if ref_ms and ms > 1.0 and ms > ref_ms * threshold:
+                regressions.append(f"{name} / {stage}: {ref_ms:.1f} ms -> {ms:.1f} ms")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del análisis de PCR por etapas.")
+    parser.add_argument("--scales", type=int, nargs="*", default=[10, 100, 1000],
+                        help="Factores de escala de pacientes para las placas sintéticas")
+    parser.add_argument("--targets", type=int, default=None,
+                        help=f"Dianas (además de ABL1) en las placas sintéticas (por defecto {BASE_TARGETS})")
+    parser.add_argument("--target-scales", type=int, nargs="*", default=[10, 100],
+                        help="Factores de escala de dianas para placas sintéticas adicionales")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1000.0,
+                        help="Tiempo total a partir del cual la placa se marca como no usable")
+    parser.add_argument("--json", help="Guarda los resultados en este archivo")
+    parser.add_argument("--compare", help="Resultados de referencia para detectar regresiones")
+    parser.add_argument("--threshold", type=float, default=1.3)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        plates = collect_plates(args.scales, args.targets, workdir, args.target_scales)
+        results = {name: bench_plate(data, args.repeat) for name, data in plates.items()}
+
+    print_report(results, args.budget_ms)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+    if args.compare:
+        regressions = compare(results, json.loads(Path(args.compare).read_text()), args.threshold)
+        for r in regressions:
+            print(f"REGRESIÓN {r}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+# benchmarks/imports.py
+# Tiempo de importación en frío de los módulos que carga la app al arrancar
+#
+#   python -m benchmarks.imports --budget-ms 1500
+import argparse
+import ast
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+APP_FILE = Path(__file__).resolve().parent.parent / "pcr_analyser.py"
+# Módulos pesados que sólo deben cargarse al dibujar, exportar, leer .xls o usar el servicio
+DEFERRED = ["matplotlib", "openpyxl", "xlrd", "pyarrow.dataset", "pyarrow.parquet", "http.server", "watchdog"]
+
+
+def app_imports(path=APP_FILE):
+    """Módulos que importa la app al arrancar: sus `import` de nivel superior, en orden."""
+    modules = []
+    for node in ast.parse(Path(path).read_text(encoding="utf-8")).body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+print(json.dumps({{"ms": (time.perf_counter() - t0) * 1000,
+                  "loaded": [m for m in {deferred!r} if m in sys.modules]}}))
+"""
+
+
+def measure(modules=None, deferred=DEFERRED):
+    """Importa `modules` (por defecto, los de la app) en un intérprete nuevo.
+
+    Devuelve ms por módulo, total y diferidos cargados.
+    """
+    modules = app_imports() if modules is None else modules
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(modules=modules, deferred=deferred)],
+        capture_output=True, text=True, check=True,
+    )
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | módulo (con sangría según profundidad)
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cum, name = line.split("|")
+        if not name.startswith("  ") and cum.strip().isdigit():
+            cumulative[name.strip()] = int(cum) / 1000
+    result = json.loads(proc.stdout)
+    return {"modules": cumulative, "total": result["ms"], "loaded": result["loaded"]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tiempo de importación en frío de la app.")
+    parser.add_argument("--budget-ms", type=float, default=1500.0,
+                        help="Presupuesto del total de importaciones (ms)")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeticiones (se toma la mejor)")
+    args = parser.parse_args(argv)
+
+    best = min((measure() for _ in range(args.repeat)), key=lambda r: r["total"])
+    for name, ms in sorted(best["modules"].items(), key=lambda kv: -kv[1])[:10]:
+        print(f"{name:<40}{ms:>10.1f} ms")
+    print(f"{'total':<40}{best['total']:>10.1f} ms (presupuesto {args.budget_ms:g} ms)")
+
+    failed = False
+    if best["loaded"]:
+        print(f"Cargados al arrancar y deberían ser diferidos: {', '.join(best['loaded'])}")
+        failed = True
+    if best["total"] > args.budget_ms:
+        print("Importación por encima del presupuesto")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
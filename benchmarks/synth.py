@@ -0,0 +1,146 @@
+# benchmarks/synth.py
+# Generador de placas sintéticas con el mismo esquema que el export del equipo
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Columnas del export de resultados del 7500 (hoja "Results")
+EXPORT_COLUMNS = [
+    "Well", "Sample Name", "Target Name", "Task", "Reporter", "Quencher",
+    "Cт", "Cт Mean", "Cт SD", "Quantity", "Quantity Mean", "Quantity SD",
+    "Automatic Ct Threshold", "Ct Threshold", "Automatic Baseline",
+    "Baseline Start", "Baseline End", "Comments", "HIGHSD", "NOAMP",
+]
+METADATA = [
+    ("Block Type", "384well"),
+    ("Chemistry", "TAQMAN"),
+    ("Experiment File Name", "synthetic.eds"),
+    ("Experiment Run End Time", "2025-01-01 12:00:00 PM CET"),
+    ("Instrument Type", "sds7500fast"),
+    ("Passive Reference", "ROX"),
+]
+STANDARD_QUANTITIES = [500000.0, 50000.0, 5000.0, 500.0, 50.0, 5.0]
+# Curvas de amplificación: ciclos y umbral con el que el Ct sintético es exacto
+CYCLES = 40
+THRESHOLD = 0.1
+
+
+def _well_names(n):
+    # Pocillos tipo A1..P24 (se extiende con letras dobles para placas grandes)
+    rows = [chr(65 + i) for i in range(26)]
+    names = []
+    for i in range(n):
+        r, c = divmod(i, 24)
+        prefix = rows[r % 26] * (r // 26 + 1)
+        names.append(f"{prefix}{c + 1}")
+    return names
+
+
+def synthesize_plate(n_patients, n_targets=2, replicates=3, seed=0):
+    """Placa sintética: ABL1 + `n_targets` dianas, estándares y pacientes.
+
+    Las rectas (pendiente ~ -3.3) y la proporción de pocillos 'Undetermined'
+    imitan las placas reales de `samples/`.
+    """
+    rng = np.random.default_rng(seed)
+    targets = ["ABL1"] + [f"T{i:03d}" for i in range(1, n_targets + 1)]
+    slopes = rng.normal(-3.3, 0.08, len(targets))
+    intercepts = rng.normal(39.0, 0.6, len(targets))
+
+    records = []
+    # Estándares por duplicado
+    for t, a, b in zip(targets, slopes, intercepts):
+        for q in STANDARD_QUANTITIES:
+            for _ in range(2):
+                ct = a * np.log10(q) + b + rng.normal(0, 0.1)
+                records.append((None, t, "STANDARD", ct, q))
+    # Pacientes por triplicado
+    for p in range(n_patients):
+        name = str(10000 + p)
+        abl1_log_q = rng.normal(4.5, 0.4)
+        for t, a, b in zip(targets, slopes, intercepts):
+            log_q = abl1_log_q if t == "ABL1" else abl1_log_q + rng.uniform(-6.5, -0.5)
+            for _ in range(replicates):
+                ct = a * (log_q + rng.normal(0, 0.05)) + b
+                if ct > 38.5 and rng.random() < 0.7:
+                    records.append((name, t, "UNKNOWN", np.nan, np.nan))
+                else:
+                    records.append((name, t, "UNKNOWN", ct, 10 ** ((ct - b) / a)))
+    for t in targets:
+        records.append((None, t, "NTC", np.nan, np.nan))
+
+    df = pd.DataFrame(records, columns=["Sample Name", "Target Name", "Task", "Cт", "Quantity"])
+    df.insert(0, "Well", _well_names(len(df)))
+    # Réplicas: mismo paciente/target o, en estándares, misma dilución
+    replicate_key = df["Quantity"].where(df["Task"] == "STANDARD")
+    grouped = df.groupby(["Sample Name", "Target Name", "Task", replicate_key], dropna=False)
+    df["Cт Mean"] = grouped["Cт"].transform("mean")
+    df["Cт SD"] = grouped["Cт"].transform("std")
+    unknown = df["Task"] == "UNKNOWN"
+    df["Quantity Mean"] = grouped["Quantity"].transform("mean").where(unknown)
+    df["Quantity SD"] = grouped["Quantity"].transform("std").where(unknown)
+    df["Reporter"], df["Quencher"] = "FAM", "TAMRA"
+    df["Automatic Ct Threshold"], df["Ct Threshold"] = True, 0.1
+    df["Automatic Baseline"], df["Baseline Start"], df["Baseline End"] = True, 3, 15
+    df["Comments"] = None
+    df["HIGHSD"] = np.where(df["Cт SD"] > 0.5, "Y", "N")
+    df["NOAMP"] = np.where(df["Cт"].isna() & (df["Task"] != "NTC"), "Y", "N")
+    return df[EXPORT_COLUMNS]
+
+
+def synthesize_amplification(df, cycles=CYCLES, seed=0):
+    """Rn por ciclo de cada pocillo: sigmoide que cruza `THRESHOLD` (sobre la línea base) en su Ct.
+
+    Los pocillos 'Undetermined' sólo tienen línea base y ruido.
+    """
+    rng = np.random.default_rng(seed)
+    c = np.arange(1, cycles + 1, dtype=float)
+    ct = df["Cт"].to_numpy(dtype=float)[:, None]
+    plateau = rng.normal(1.6, 0.15, (len(df), 1))
+    steepness = 1.3
+    midpoint = ct + steepness * np.log(plateau / THRESHOLD - 1)
+    delta_rn = np.where(np.isnan(ct), 0.0, plateau / (1 + np.exp(-(c - midpoint) / steepness)))
+    baseline = rng.normal(1.0, 0.05, (len(df), 1)) + rng.normal(0.002, 0.0005, (len(df), 1)) * c
+    rn = baseline + delta_rn + rng.normal(0, 0.004, (len(df), cycles))
+    return pd.DataFrame({
+        "Well": np.repeat(df["Well"].to_numpy(), cycles),
+        "Cycle": np.tile(np.arange(1, cycles + 1), len(df)),
+        "Rn": rn.ravel().round(5),
+    })
+
+
+def write_text_export(df, path, amplification=None):
+    """Escribe la placa como export de texto tabulado (metadatos + tabla).
+
+    Con `amplification` se añade la sección "[Amplification Data]".
+    """
+    table = df.copy()
+    table["Cт"] = table["Cт"].map(lambda v: "Undetermined" if pd.isna(v) else f"{v:.6f}")
+    with open(path, "w", encoding="utf-8") as fh:
+        for key, value in METADATA:
+            fh.write(f"{key}\t{value}\n")
+        fh.write("\n")
+        table.to_csv(fh, sep="\t", index=False, lineterminator="\n")
+        if amplification is not None:
+            fh.write("\n[Amplification Data]\n")
+            amplification.to_csv(fh, sep="\t", index=False, lineterminator="\n")
+    return Path(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera placas sintéticas en formato de export de texto.")
+    parser.add_argument("output", help="Archivo .txt de salida")
+    parser.add_argument("--patients", type=int, default=20)
+    parser.add_argument("--targets", type=int, default=2, help="Dianas además de ABL1")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--amplificacion", action="store_true", help="Incluir los datos de amplificación (Rn por ciclo)")
+    args = parser.parse_args(argv)
+    plate = synthesize_plate(args.patients, args.targets, seed=args.seed)
+    amplification = synthesize_amplification(plate, seed=args.seed) if args.amplificacion else None
+    write_text_export(plate, args.output, amplification)
+
+
+if __name__ == "__main__":
+    main()
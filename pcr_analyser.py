@@ -1,9 +1,20 @@
 # pcr_analyser.py
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
-import numpy as np
 import streamlit as st
-import matplotlib.pyplot as plt
-from io import BytesIO
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from pcr_archive import append_run, archive_rows, patient_history
+from pcr_calibration import CalibrationStore
+from pcr_charts import standard_curves_spec
+from pcr_core import factor_tables, read_run
+from pcr_ct import CtCalling
+from pcr_pipeline import run_pipeline
+from pcr_timing import StageLog, configure_logging, stage
 
 st.set_page_config(page_title="PCR Analyzer", layout="wide")
 
@@ -13,227 +24,287 @@ st.markdown(
     unsafe_allow_html=True
 )
 
-uploaded_file = st.file_uploader("Sube tu archivo .xls", type=["xls","xlsx"])
+uploaded_files = st.file_uploader(
+    "Sube tus archivos .xls", type=["xls","xlsx","txt"], accept_multiple_files=True
+)
 multiplicador = st.selectbox("Multiplicar ratio por:", [100, 10000])
-
-if uploaded_file:
-    df = pd.read_excel(uploaded_file, skiprows=7)
-
-    # Pacientes reales
-    df_patients = df[df["Task"]=="UNKNOWN"].copy()
-    df_patients["Quantity Mean"] = pd.to_numeric(df_patients["Quantity Mean"], errors='coerce')
-
-    # Curvas estándar
-    df_standard = df[df["Task"]=="STANDARD"].copy()
-    df_standard["Quantity"] = pd.to_numeric(df_standard["Quantity"], errors='coerce')
-    df_standard["Cт"] = pd.to_numeric(df_standard["Cт"], errors='coerce')
-
-    # Calcular rectas de regresión y factores de conversión
-    regression_dict = {}
-    pair_factors_dict = {}
+own_curve = st.checkbox("Recalcular Quantity con las rectas del run", help=(
+    "Calcula la Quantity de cada pocillo con la recta ajustada (o reutilizada) y sus medias, "
+    "en lugar de usar las medias del equipo; así las exclusiones de pocillos afectan a los ratios."
+))
+own_ct = st.checkbox("Calcular el Ct desde los datos de amplificación", help=(
+    "Ignora el Ct del equipo: resta la línea base de cada pocillo y busca el cruce con un umbral "
+    "común. Requiere exportar también los datos de amplificación; la Quantity se recalcula con las rectas."
+))
+ct_calling = None
+if own_ct:
+    cols = st.columns(3)
+    umbral = cols[0].number_input("Umbral de ΔRn (0 = automático)", min_value=0.0, value=0.0, step=0.01, format="%.3f")
+    base_inicio = cols[1].number_input("Línea base: ciclo inicial", min_value=1, value=3)
+    base_fin = cols[2].number_input("Línea base: ciclo final", min_value=2, value=15)
+    try:
+        ct_calling = CtCalling(umbral or None, int(base_inicio), int(base_fin))
+    except ValueError as exc:
+        st.error(str(exc))
+        st.stop()
+lote = st.text_input("Lote de calibrador (opcional)", help=(
+    "Las rectas del run se guardan en la biblioteca de calibraciones con este lote (botón en «Rectas de regresión»); "
+    "si un target no tiene estándares válidos se reutiliza la última recta válida guardada del mismo lote "
+    "(sin lote no se reutiliza ninguna)."
+))
+debug = st.toggle("Depuración: tiempos y memoria por etapa", help=(
+    "Mide cada etapa (lectura, rectas, tablas, gráficos, Excel) y la escribe en el log; ralentiza el cálculo."
+))
+# Registro de esta ejecución del script (sólo con depuración activa)
+stage_log = StageLog() if debug else None
+if debug:
+    configure_logging()
+
+# Servicio de análisis (pcr_service); se importa sólo si está configurado
+SERVICE_URL = os.environ.get("PCR_SERVICE_URL", "")
+
+# Nº máximo de runs parseados que se mantienen en caché (LRU)
+CACHE_MAX_RUNS = 16
+# Hilos para parsear y ajustar varios archivos a la vez
+MAX_PARSE_WORKERS = 4
+
+
+@st.cache_data(max_entries=CACHE_MAX_RUNS, show_spinner=False)
+def read_run_cached(file_bytes):
+    """Parsea el export; la caché se indexa por el contenido del archivo."""
+    return read_run(file_bytes)
+
+
+def reuse_from_library(run, lot):
+    with CalibrationStore() as store:
+        return store.reuse_missing(run, lot=lot or None)
+
+
+@st.cache_data(max_entries=CACHE_MAX_RUNS, show_spinner=False)
+def export_cached(file_keys, lote, multiplicador, own_curve, ct_calling, exclusions, _items):
+    """Libro de resultados de los runs `file_keys`, generado una sola vez por combinación."""
+    from pcr_export import export_runs
+
+    return export_runs(_items)
+
+
+@st.cache_data(max_entries=CACHE_MAX_RUNS, show_spinner=False)
+def analyze_remote(file_key, multiplicador, lote, own_curve, ct_calling, excluded, _data):
+    """Análisis hecho por el servicio (PCR_SERVICE_URL), una vez por combinación."""
+    from pcr_service import ServiceClient
+
+    run, summary_df, summary_ct_df = ServiceClient(SERVICE_URL).analyze(
+        _data, multiplicador, lote, own_curve, excluded, ct_calling
+    )
+    return run, (summary_df, summary_ct_df)
+
+
+def well_review(file_key, data, excluded):
+    """Editor de pocillos de un run; devuelve el conjunto de pocillos excluidos."""
+    table = read_run_cached(data)
+    wells = table[table["Task"].isin(["UNKNOWN", "STANDARD"])]
+    cols = [c for c in ["Well", "Sample Name", "Target Name", "Task", "Cт", "Quantity", "HIGHSD"] if c in wells]
+    view = wells[cols].assign(Incluir=~wells["Well"].isin(excluded))
+    # La clave cambia con las exclusiones para que el editor parta siempre del estado guardado
+    state = hashlib.sha256("|".join(sorted(excluded)).encode()).hexdigest()[:12]
+    edited = st.data_editor(view, disabled=cols, hide_index=True, key=f"pocillos_{file_key}_{state}")
+    return frozenset(edited.loc[~edited["Incluir"], "Well"])
+
+
+def load_runs(files, exclusions):
+    """Calcula el grafo de cada archivo en paralelo; cada run conserva sus propias rectas.
+
+    `files` es una lista de (nombre, hash, bytes) y `exclusions` los pocillos
+    excluidos por hash. Los grafos viven en la sesión, así que en cada rerun
+    sólo se recalculan las etapas afectadas por lo que haya cambiado
+    (multiplicador, lote, pocillos excluidos...). Con PCR_SERVICE_URL el
+    cálculo se delega en el servicio de análisis.
+    Devuelve una lista de (nombre, hash del archivo, RunAnalysis, tablas).
+    """
+    keys = [key for _, key, _ in files]
+    payloads = [data for _, _, data in files]
+    pipelines = st.session_state.setdefault("pipelines", {})
+    # Sólo se conservan los grafos de los archivos subidos ahora
+    for key in set(pipelines) - set(keys):
+        del pipelines[key]
+
+    names = {key: name for name, key, _ in files}
+
+    def compute(key, data):
+        if SERVICE_URL:
+            with stage(stage_log, "servicio", names[key]):
+                return analyze_remote(
+                    key, multiplicador, lote, own_curve, ct_calling, exclusions.get(key, frozenset()), data
+                )
+        p = pipelines.get(key)
+        if p is None:
+            p = pipelines[key] = run_pipeline(parse=read_run_cached, reuse_curves=reuse_from_library)
+            p.set("file_bytes", data)
+        p.stage_log, p.label = stage_log, names[key]
+        p.set("excluded_wells", exclusions.get(key, frozenset()))
+        p.set("lot", lote)
+        p.set("multiplicador", multiplicador)
+        p.set("own_curve", own_curve)
+        p.set("ct_calling", ct_calling)
+        return p.get("calibrated"), p.get("summary")
+
+    ctx = get_script_run_ctx()
+    with ThreadPoolExecutor(
+        max_workers=min(MAX_PARSE_WORKERS, len(payloads)),
+        initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx),
+    ) as pool:
+        results = list(pool.map(compute, keys, payloads))
+    return [
+        (name, key, run, tables)
+        for (name, key, _), (run, tables) in zip(files, results)
+    ]
+
+
+if uploaded_files:
+    files = [(f.name, hashlib.sha256(f.getvalue()).hexdigest(), f.getvalue()) for f in uploaded_files]
+    multiple = len(files) > 1
+
+    # Revisión de pocillos: excluir réplicas reajusta sólo el target o el paciente afectado
+    exclusions = st.session_state.setdefault("exclusiones", {})
+    if st.toggle("Revisión de pocillos (excluir réplicas)"):
+        for name, file_key, data in files:
+            if multiple:
+                st.markdown(f"#### {name}")
+            exclusions[file_key] = well_review(file_key, data, exclusions.get(file_key, frozenset()))
+
+    try:
+        runs = load_runs(files, exclusions)
+    except (ValueError, RuntimeError) as exc:
+        # Export sin datos de amplificación, cabecera no encontrada, servicio caído o sin respuesta...
+        st.error(str(exc))
+        st.stop()
 
     with st.expander("Rectas de regresión"):
-        for target in df_standard["Target Name"].unique():
-            t_df = df_standard[df_standard["Target Name"]==target]
-            grouped = t_df.groupby("Quantity")
-            x_vals, y_vals = [], []
-            pair_factors = []
-
-            for qty, group in grouped:
-                ct_vals = group["Cт"].values
-                # Detectar Undetermined
-                n_undetermined = np.sum(pd.isna(ct_vals))
-                if n_undetermined > 0:
-                    if n_undetermined == 1:
-                        st.warning(f"{target}, Quantity {qty}: 1 Ct de 2 está 'Undetermined'")
-                    else:
-                        st.warning(f"{target}, Quantity {qty}: Ambos Ct están 'Undetermined'")
-                    ct_vals = [ct for ct in ct_vals if pd.notna(ct)]  # ignorar NaN
-
-                if len(ct_vals) == 0:
-                    continue
-                elif len(ct_vals) == 1:
-                    x_vals.append(np.log10(qty))
-                    y_vals.append(ct_vals[0])
-                    pair_factors.append({"Quantity": qty, "Ct_pair": ct_vals})
-                else:
-                    x_vals.append(np.log10(qty))
-                    y_vals.append(ct_vals.mean())
-                    pair_factors.append({"Quantity": qty, "Ct_pair": ct_vals})
-
-            if len(x_vals) > 1:
-                a, b = np.polyfit(x_vals, y_vals, 1)
-                regression_dict[target] = {
-                    "a": a, "b": b,
-                    "x_vals": x_vals, "y_vals": y_vals,
-                    "raw_points": t_df
-                }
-
-                for pf in pair_factors:
-                    ct_pair = pf["Ct_pair"]
-                    expected_qties = [10**((ct - b)/a) for ct in ct_pair]
-                    pf["Factor"] = round(pf["Quantity"] / np.mean(expected_qties), 2)
-                    pf.pop("Ct_pair")
-                pair_factors_dict[target] = pair_factors
-                st.write(f"{target}: Ct = {a:.3f}*log10(Quantity) + {b:.3f}")
-
-    with st.expander("Factores de conversión"):
-        targets = list(pair_factors_dict.keys())
-        for i in range(0, len(targets), 2):
-            cols = st.columns(2)
-            for j, col in enumerate(cols):
-                if i+j < len(targets):
-                    target = targets[i+j]
-                    pf_list = pair_factors_dict[target]
-                    if pf_list:
-                        table = pd.DataFrame(pf_list)
-                        table = table.rename(columns={
-                            "Quantity": "Quantity (par)",
-                            "Factor": "Factor de Conversión"
-                        })
-                        col.markdown(f"**{target}**")
-                        col.dataframe(table)
-
-    with st.expander("Curvas patrón de cada Target"):
-        fig, ax = plt.subplots(figsize=(8,6))
-        for target, reg in regression_dict.items():
-            x_plot = np.linspace(min(reg["x_vals"]), max(reg["x_vals"]), 100)
-            y_plot = reg["a"]*x_plot + reg["b"]
-            ax.plot(x_plot, y_plot, label=f"{target}")
-
-            raw_points = reg["raw_points"]
-            ax.scatter(np.log10(raw_points["Quantity"]), raw_points["Cт"], s=10, alpha=0.7)
-        ax.set_xlabel("log10(Quantity)")
-        ax.set_ylabel("Ct")
-        ax.set_title("Curvas patrón de cada Target")
-        ax.legend()
-        st.pyplot(fig)
+        for name, _, run, _ in runs:
+            if multiple:
+                st.markdown(f"**{name}**")
+            for aviso in run.warnings:
+                st.warning(aviso.message)
+            for target, reg in run.regression.items():
+                st.write(
+                    f"{target}: Ct = {reg['a']:.3f}*log10(Quantity) + {reg['b']:.3f}"
+                    f" (R² = {reg['r2']:.4f}, eficiencia = {reg['efficiency']:.1%})"
+                    + ("" if run.curve_source[target] == "run" else f" — recta de {run.curve_source[target]}")
+                )
+        # Biblioteca: sólo al confirmar, con las rectas tal y como quedan tras revisar los pocillos
+        if st.button("Guardar rectas en la biblioteca", help=(
+            "Guarda las rectas válidas de estos runs (tras las exclusiones) con el lote indicado; "
+            "las reutilizadas de la biblioteca no se vuelven a guardar."
+        )):
+            with CalibrationStore() as store:
+                for name, file_key, run, _ in runs:
+                    store.save_run(run, lote)
+            st.success(f"Rectas de {len(runs)} run(s) guardadas" + (f" con el lote {lote}" if lote else ""))
+
+    # Las tablas de factores y el gráfico sólo se generan si el usuario los abre
+    if st.toggle("Factores de conversión"):
+        for name, _, run, _ in runs:
+            if multiple:
+                st.markdown(f"#### {name}")
+            tables = list(factor_tables(run.pair_factors).items())
+            for i in range(0, len(tables), 2):
+                for col, (target, table) in zip(st.columns(2), tables[i:i+2]):
+                    col.markdown(f"**{target}**")
+                    col.dataframe(table)
+
+    if st.toggle("Curvas patrón de cada Target"):
+        for name, file_key, run, _ in runs:
+            if multiple:
+                st.markdown(f"#### {name}")
+            # Sólo se envían los datos; el gráfico (con tooltips por pocillo) se dibuja en el navegador
+            with stage(stage_log, "curvas", name):
+                st.vega_lite_chart(standard_curves_spec(run.regression, run.pair_factors), width="stretch")
+
+    export_items, quantity_tables, ct_tables = [], [], []
+    for name, file_key, run, (summary_df, summary_ct_df) in runs:
+        export_items.append((name, run, summary_df, summary_ct_df))
+        quantity_tables.append(summary_df.assign(Run=name))
+        ct_tables.append(summary_ct_df.assign(Run=name))
+
+    # Vista combinada de todos los runs, filtrable
+    summary_df = pd.concat(quantity_tables, ignore_index=True).sort_values("Ratio", kind="stable")
+    summary_ct_df = pd.concat(ct_tables, ignore_index=True).sort_values("Ratio (2^ΔCt)", kind="stable")
+    if not multiple:
+        summary_df, summary_ct_df = summary_df.drop(columns="Run"), summary_ct_df.drop(columns="Run")
+
+    cols = st.columns(3)
+    sel_runs = cols[0].multiselect("Runs", [name for name, _, _, _ in runs]) if multiple else []
+    sel_targets = cols[1].multiselect("Targets", sorted(summary_df["Target"].dropna().unique()))
+    sel_patient = cols[2].text_input("Paciente contiene")
+
+    def filtered(df):
+        mask = pd.Series(True, index=df.index)
+        if sel_runs:
+            mask &= df["Run"].isin(sel_runs)
+        if sel_targets:
+            mask &= df["Target"].isin(sel_targets)
+        if sel_patient:
+            mask &= df["Paciente"].astype(str).str.contains(sel_patient, regex=False)
+        return df[mask]
 
     # ==========================
     # TABLA 1: con Quantity
     # ==========================
-    summary_list = []
-    for patient in df_patients["Sample Name"].unique():
-        patient_df = df_patients[df_patients["Sample Name"]==patient]
-        abl1_mean = patient_df[patient_df["Target Name"]=="ABL1"]["Quantity Mean"].mean()
-        targets = [t for t in patient_df["Target Name"].unique() if t!="ABL1"]
-
-        for target in targets:
-            target_df = patient_df[patient_df["Target Name"]==target]
-            quantity_mean = target_df["Quantity Mean"].mean()
-            n_positive = target_df["Quantity"].notna().sum()
-
-            if n_positive == 1:
-                aviso, extra = "Sólo 1/3 positivo", "Repetir"
-            elif n_positive == 2:
-                aviso, extra = "Sólo 2/3 positivo", ""
-            else:
-                aviso, extra = "", ""
-
-            ratio, fc = 0.0, 1.0
-            if quantity_mean>0 and abl1_mean>0:
-                ratio = (quantity_mean / abl1_mean) * multiplicador
-
-            if ratio>0 and target in pair_factors_dict:
-                pf_list = pair_factors_dict[target]
-                log_q_patient = np.log10(quantity_mean)
-                diffs = [abs(np.log10(pf["Quantity"]) - log_q_patient) for pf in pf_list]
-                idx = np.argmin(diffs)
-                fc = pf_list[idx]["Factor"]
-                ratio *= fc
-
-            if abl1_mean<10000:
-                interpretacion = "No valorable"
-            elif ratio==0:
-                if abl1_mean<32000: interpretacion="Al menos MR4"
-                elif abl1_mean<100000: interpretacion="Al menos MR4.5"
-                else: interpretacion="Al menos MR5"
-            else:
-                if ratio>0.1: interpretacion="Ausencia de MR"
-                elif 0.01<ratio<=0.1: interpretacion="MR3"
-                elif 0.0032<ratio<=0.01: interpretacion="MR4"
-                elif 0.001<ratio<=0.0032: interpretacion="MR4.5"
-                else: interpretacion="MR5"
-            if extra: interpretacion += f" ({extra})"
-
-            summary_list.append({
-                "Interpretación": interpretacion,
-                "Paciente": patient,
-                "Target": target,
-                "Quantity Mean": round(quantity_mean,1),
-                "ABL1 Mean": round(abl1_mean,1),
-                "Ratio": round(ratio,4),
-                "FC": round(fc,2),
-                "Aviso": aviso
-            })
-
-    summary_df = pd.DataFrame(summary_list).sort_values("Ratio")
     st.subheader("Tabla Resumen (Quantity/ABL1)")
-    st.dataframe(summary_df)
-
-    towrite = BytesIO()
-    summary_df.to_excel(towrite, index=False, engine='openpyxl')
-    towrite.seek(0)
-    st.download_button("Descargar tabla resumen", towrite, "tabla_resumen_final.xlsx")
+    with stage(stage_log, "tabla Quantity"):
+        st.dataframe(filtered(summary_df))
 
     # ==========================
     # TABLA 2: con ΔCt
     # ==========================
-    summary_ct_list = []
-    for patient in df_patients["Sample Name"].unique():
-        patient_df = df_patients[df_patients["Sample Name"]==patient]
-        abl1_mean = patient_df[patient_df["Target Name"]=="ABL1"]["Quantity Mean"].mean()
-        abl1_ct_mean = pd.to_numeric(patient_df[patient_df["Target Name"]=="ABL1"]["Cт Mean"], errors='coerce').mean()
-        targets = [t for t in patient_df["Target Name"].unique() if t!="ABL1"]
-
-        for target in targets:
-            target_ct_mean = pd.to_numeric(patient_df[patient_df["Target Name"]==target]["Cт Mean"], errors='coerce').mean()
-            
-            aviso, extra = "", ""
-            n_positive = patient_df[patient_df["Target Name"]==target]["Quantity"].notna().sum()
-            if n_positive == 1:
-                aviso, extra = "Sólo 1/3 positivo", "Repetir"
-            elif n_positive == 2:
-                aviso, extra = "Sólo 2/3 positivo", ""
-
-            ratio_ct, delta_ct = 0.0, None
-            if pd.notna(abl1_ct_mean) and pd.notna(target_ct_mean):
-                delta_ct = abl1_ct_mean - target_ct_mean
-                ratio_ct = (2 ** delta_ct) * multiplicador
-
-            if abl1_mean < 10000:
-                interpretacion = "No valorable"
-            elif ratio_ct==0:
-                if abl1_mean<32000: interpretacion="Al menos MR4"
-                elif abl1_mean<100000: interpretacion="Al menos MR4.5"
-                else: interpretacion="Al menos MR5"
-            else:
-                if ratio_ct>0.1: interpretacion="Ausencia de MR"
-                elif 0.01<ratio_ct<=0.1: interpretacion="MR3"
-                elif 0.0032<ratio_ct<=0.01: interpretacion="MR4"
-                elif 0.001<ratio_ct<=0.0032: interpretacion="MR4.5"
-                else: interpretacion="MR5"
-            if extra: interpretacion += f" ({extra})"
-
-            summary_ct_list.append({
-                "Interpretación": interpretacion,
-                "Paciente": patient,
-                "Target": target,
-                "Ct Mean Target": round(target_ct_mean,2) if pd.notna(target_ct_mean) else None,
-                "Ct Mean ABL1": round(abl1_ct_mean,2) if pd.notna(abl1_ct_mean) else None,
-                "ΔCt (ABL1-Target)": round(delta_ct,2) if delta_ct is not None else None,
-                "Ratio (2^ΔCt)": round(ratio_ct,4),
-                "Aviso": aviso
-            })
-
-    summary_ct_df = pd.DataFrame(summary_ct_list).sort_values("Ratio (2^ΔCt)")
     st.subheader("Tabla Resumen basada en ΔCt")
-    st.dataframe(summary_ct_df)
-
-    towrite_ct = BytesIO()
-    summary_ct_df.to_excel(towrite_ct, index=False, engine='openpyxl')
-    towrite_ct.seek(0)
-    st.download_button("Descargar tabla ΔCt", towrite_ct, "tabla_resumen_ct.xlsx")
+    with stage(stage_log, "tabla ΔCt"):
+        st.dataframe(filtered(summary_ct_df))
+
+    # El libro sólo se genera al pulsar el botón (una vez por conjunto de runs y multiplicador)
+    file_keys = tuple(file_key for _, file_key, _, _ in runs)
+
+    def export_workbook():
+        with stage(stage_log, "excel", ", ".join(name for name, _, _, _ in runs)):
+            return export_cached(
+                file_keys, lote, multiplicador, own_curve, ct_calling,
+                tuple(exclusions.get(k, frozenset()) for k in file_keys), export_items,
+            )
+
+    st.download_button("Descargar resultados (Excel)", export_workbook, "tabla_resumen_final.xlsx")
+
+    # Archivo longitudinal: sólo al confirmar, con los ajustes y exclusiones actuales;
+    # volver a archivar un run sustituye lo archivado antes para él
+    if st.button("Archivar resultados", help=(
+        "Guarda las tablas mostradas (con este multiplicador, exclusiones y cálculo) en el archivo "
+        "de resultados para el seguimiento de pacientes."
+    )):
+        for name, file_key, run, (summary_df, summary_ct_df) in runs:
+            append_run(archive_rows(run, summary_df, summary_ct_df, file_key[:16], multiplicador))
+        st.success(f"Archivados {len(runs)} run(s) con multiplicador x{multiplicador}")
+
+# ==========================
+# Seguimiento de paciente (desde el archivo de resultados)
+# ==========================
+if st.toggle("Seguimiento de paciente"):
+    paciente = st.text_input("Paciente (Sample Name)")
+    if paciente:
+        # Sólo runs archivados con el multiplicador seleccionado: los ratios son comparables
+        history = patient_history(paciente, multiplicador=multiplicador)
+        if history.empty:
+            st.info(f"No hay resultados archivados para {paciente} con multiplicador x{multiplicador}")
+        else:
+            from pcr_plots import figure_png, patient_trend_figure
+
+            target = st.selectbox("Target", sorted(history["target"].unique()))
+            with stage(stage_log, "seguimiento", paciente):
+                st.image(figure_png(patient_trend_figure(history, target, multiplicador=multiplicador)))
+            st.dataframe(history[history["target"]==target])
+
+if stage_log is not None:
+    with st.expander("Tiempos por etapa", expanded=True):
+        st.caption("Etapas recalculadas en esta ejecución; el Excel se registra al descargarlo.")
+        st.dataframe(stage_log.table())
 
 # Footer
 st.markdown(
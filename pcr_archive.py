@@ -0,0 +1,144 @@
+# pcr_archive.py
+# Archivo columnar (Parquet) de resultados para el seguimiento longitudinal de pacientes
+import os
+import zlib
+
+import pandas as pd
+
+# Directorio por defecto del archivo (se puede cambiar con PCR_ARCHIVE_DIR)
+DEFAULT_ARCHIVE = os.environ.get("PCR_ARCHIVE_DIR", "archivo_resultados")
+# Nº de cubos por paciente dentro de cada target; una consulta sólo abre un cubo
+PATIENT_BUCKETS = 64
+
+ARCHIVE_COLUMNS = [
+    "run_id", "run_date", "patient", "target", "ratio", "fc", "quantity_mean",
+    "abl1_mean", "interpretacion", "delta_ct", "ratio_ct", "interpretacion_ct",
+    "multiplicador", "archived_at",
+]
+
+
+def patient_bucket(patient):
+    """Cubo estable (crc32) de un paciente."""
+    return zlib.crc32(str(patient).encode("utf-8")) % PATIENT_BUCKETS
+
+
+def archive_rows(run, summary_df, summary_ct_df, run_id, multiplicador):
+    """Filas de archivo de un run: una por paciente/target con ambas tablas."""
+    key = ["Paciente", "Target"]
+    merged = summary_df.merge(summary_ct_df, on=key, how="outer", suffixes=("", " ΔCt"))
+    rows = pd.DataFrame({
+        "run_id": run_id,
+        "run_date": pd.to_datetime(run.run_date),
+        "patient": merged["Paciente"].astype(str),
+        "target": merged["Target"].astype(str),
+        "ratio": merged["Ratio"],
+        "fc": merged["FC"],
+        "quantity_mean": merged["Quantity Mean"],
+        "abl1_mean": merged["ABL1 Mean"],
+        "interpretacion": merged["Interpretación"],
+        "delta_ct": merged["ΔCt (ABL1-Target)"],
+        "ratio_ct": merged["Ratio (2^ΔCt)"],
+        "interpretacion_ct": merged["Interpretación ΔCt"],
+        "multiplicador": multiplicador,
+        # Orden de escritura: al re-archivar un run gana la versión más reciente
+        "archived_at": pd.Timestamp.now(tz="UTC"),
+    }, columns=ARCHIVE_COLUMNS)
+    return rows
+
+
+def append_run(rows, root=DEFAULT_ARCHIVE):
+    """Añade las filas de un run al dataset particionado por target/cubo de paciente.
+
+    Cada run escribe un archivo por partición con su `run_id` en el nombre, así
+    que volver a archivar el mismo run lo sustituye en lugar de duplicarlo.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if rows.empty:
+        return
+    rows = rows.assign(bucket=rows["patient"].map(patient_bucket)).sort_values("patient")
+    run_id = rows["run_id"].iloc[0]
+    pq.write_to_dataset(
+        pa.Table.from_pandas(rows, preserve_index=False),
+        root,
+        partition_cols=["target", "bucket"],
+        basename_template=f"{run_id}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+def _dataset(files, **kwargs):
+    # Esquema unificado: los archivos anteriores a `archived_at` no tienen esa columna
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(files, format="parquet", **kwargs)
+    schema = pa.unify_schemas(
+        [dataset.schema] + [f.physical_schema for f in dataset.get_fragments()], promote_options="permissive"
+    )
+    return ds.dataset(files, format="parquet", schema=schema, **kwargs)
+
+
+def _latest(rows, key):
+    """Una fila por `key`: la archivada más tarde (las que no tienen fecha cuentan como más antiguas)."""
+    if "archived_at" not in rows:
+        rows = rows.assign(archived_at=pd.NaT)
+    rows = rows.sort_values("archived_at", kind="stable", na_position="first")
+    return rows.drop_duplicates(key, keep="last")
+
+
+def _patient_files(root, bucket, target=None):
+    # Índice por ruta: sólo se listan los directorios target=*/bucket=<cubo>
+    import glob
+
+    target_dir = "*" if target is None else f"target={target}"
+    return sorted(glob.glob(os.path.join(root, target_dir, f"bucket={bucket}", "*.parquet")))
+
+
+def patient_history(patient, target=None, root=DEFAULT_ARCHIVE, multiplicador=None):
+    """Historial de un paciente (opcionalmente de un target), ordenado por fecha.
+
+    Con `multiplicador`, sólo los runs archivados con ese multiplicador (los
+    ratios de runs con distinto multiplicador no son comparables). Sólo se abren los archivos de la partición del paciente (target y cubo);
+    dentro de ellos, el filtro por paciente usa las estadísticas de cada
+    row group.
+    """
+    import pyarrow.dataset as ds
+
+    patient = str(patient)
+    files = _patient_files(root, patient_bucket(patient), target)
+    if not files:
+        return pd.DataFrame(columns=ARCHIVE_COLUMNS)
+    dataset = _dataset(files, partitioning="hive", partition_base_dir=root)
+    condition = ds.field("patient") == patient
+    if multiplicador is not None:
+        condition &= ds.field("multiplicador") == multiplicador
+    columns = [c for c in ARCHIVE_COLUMNS if c in dataset.schema.names]
+    history = dataset.to_table(filter=condition, columns=columns).to_pandas()
+    # Un run re-archivado tras compactar aparece dos veces
+    history = _latest(history, ["run_id", "patient", "target"])
+    return history.sort_values(["target", "run_date"], kind="stable").reset_index(drop=True)
+
+
+def compact_archive(root=DEFAULT_ARCHIVE):
+    """Reescribe cada partición en un único archivo ordenado por paciente y fecha.
+
+    Con miles de runs el coste de una consulta lo domina el nº de archivos;
+    compactar periódicamente lo mantiene en uno por partición.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    for dirpath, _, files in os.walk(root):
+        parts = [f for f in files if f.endswith(".parquet")]
+        if len(parts) < 2:
+            continue
+        table = _dataset([os.path.join(dirpath, f) for f in parts]).to_table().to_pandas()
+        table = pa.Table.from_pandas(_latest(table, ["run_id", "patient"]), preserve_index=False)
+        table = table.sort_by([("patient", "ascending"), ("run_date", "ascending")])
+        tmp = os.path.join(dirpath, "compacted.parquet.tmp")
+        pq.write_table(table, tmp, row_group_size=4096)
+        for f in parts:
+            os.remove(os.path.join(dirpath, f))
+        os.replace(tmp, os.path.join(dirpath, "compacted.parquet"))
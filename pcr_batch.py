@@ -0,0 +1,212 @@
+# pcr_batch.py
+# Reprocesado por lotes de exports del equipo, sin interfaz.
+#
+#   python pcr_batch.py samples/ -o resultados/ --multiplicador 100 --workers 4
+import argparse
+import hashlib
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+from pathlib import Path
+
+import pandas as pd
+
+from pcr_archive import append_run, archive_rows
+from pcr_calibration import CalibrationStore
+from pcr_core import analyze_run
+from pcr_ct import CtCalling
+from pcr_export import export_run, write_workbook
+from pcr_rules import load_rules
+from pcr_service import SERVICE_URL, ServiceClient
+from pcr_timing import StageLog, configure_logging, stage
+
+EXTENSIONES = (".xls", ".xlsx", ".txt")
+
+
+def collect_inputs(paths):
+    """Expande directorios a sus exports, conservando el orden dado."""
+    files = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            files.extend(sorted(f for f in p.iterdir() if f.suffix.lower() in EXTENSIONES))
+        else:
+            files.append(p)
+    return files
+
+
+def analyze_and_save(path, calibration_db=None, lot="", timings=False, ct_calling=None):
+    """Primera fase: analiza un run y guarda sus rectas válidas en la biblioteca."""
+    log, name = StageLog() if timings else None, Path(path).name
+    with stage(log, "analisis", name):
+        run = analyze_run(path, ct_calling)
+    if calibration_db:
+        with stage(log, "calibraciones", name), CalibrationStore(calibration_db) as store:
+            store.save_run(run, lot)
+    return run
+
+
+def finish_run(path, run, output_dir, multiplicador, calibration_db=None, lot="", archive_dir=None,
+               own_curve=False, rules_file=None, timings=False, ct_calling=None):
+    """Segunda fase: completa rectas desde la biblioteca, resume, exporta y archiva."""
+    log, name = StageLog() if timings else None, Path(path).name
+    if calibration_db:
+        with stage(log, "reutilizacion", name), CalibrationStore(calibration_db) as store:
+            run = store.reuse_missing(run, lot=lot or None)
+    with stage(log, "resumen", name):
+        summary_df, summary_ct_df = run.summarize(
+            multiplicador, own_curve or ct_calling is not None, load_rules(rules_file) if rules_file else None
+        )
+    return _write_outputs(path, run, summary_df, summary_ct_df, output_dir, multiplicador, archive_dir, log)
+
+
+def _write_outputs(path, run, summary_df, summary_ct_df, output_dir, multiplicador, archive_dir, log):
+    name = Path(path).name
+    with stage(log, "excel", name):
+        export_run(run, summary_df, summary_ct_df, Path(output_dir) / f"{Path(path).stem}_resumen.xlsx")
+    if archive_dir:
+        run_id = hashlib.sha256(Path(path).read_bytes()).hexdigest()[:16]
+        with stage(log, "archivo", name):
+            append_run(archive_rows(run, summary_df, summary_ct_df, run_id, multiplicador), archive_dir)
+    return summary_df, summary_ct_df, [w.message for w in run.warnings]
+
+
+def process_run(path, output_dir, multiplicador, calibration_db=None, lot="", archive_dir=None, own_curve=False,
+                rules_file=None, timings=False, service_url=None, ct_calling=None):
+    """Analiza un run y escribe su libro con las dos tablas resumen.
+
+    Con `calibration_db`, los targets sin recta válida reutilizan la última
+    recta guardada y las rectas del run se añaden a la biblioteca. Con
+    `archive_dir`, las filas resumen se añaden al archivo Parquet. Con
+    `own_curve`, las Quantity se recalculan con las rectas del run.
+    `rules_file` es un JSON de reglas MR distinto del de por defecto. Con
+    `timings`, el tiempo y la memoria de cada etapa van al log (stderr).
+    Con `service_url`, el análisis lo hace el servicio (`pcr_service`), con
+    sus propias reglas y biblioteca; aquí sólo se guardan las rectas. Con
+    `ct_calling` (`pcr_ct.CtCalling`), el Ct se calcula desde los datos de
+    amplificación y la Quantity con las rectas del run. Para varios runs,
+    `process_runs` hace que las rectas reutilizadas no dependan del orden.
+    """
+    if not service_url:
+        run = analyze_and_save(path, calibration_db, lot, timings, ct_calling)
+        return finish_run(path, run, output_dir, multiplicador, calibration_db, lot, archive_dir,
+                          own_curve, rules_file, timings, ct_calling)
+    log, name = StageLog() if timings else None, Path(path).name
+    with stage(log, "servicio", name):
+        run, summary_df, summary_ct_df = ServiceClient(service_url).analyze(
+            Path(path).read_bytes(), multiplicador, lot, own_curve, ct_calling=ct_calling
+        )
+    if calibration_db:
+        with stage(log, "calibraciones", name), CalibrationStore(calibration_db) as store:
+            store.save_run(run, lot)
+    return _write_outputs(path, run, summary_df, summary_ct_df, output_dir, multiplicador, archive_dir, log)
+
+
+def process_runs(pool, paths, output_dir, multiplicador, calibration_db=None, lot="", archive_dir=None,
+                 own_curve=False, rules_file=None, timings=False, service_url=None, ct_calling=None):
+    """Procesa varios runs en `pool`; devuelve {ruta: Future con el resultado de `process_run`}.
+
+    Con biblioteca de calibraciones se trabaja en dos fases: primero se
+    analizan todos los runs y se guardan sus rectas, y después, por fecha de
+    run, cada uno reutiliza las que le falten. Así el resultado no depende
+    del orden de los archivos ni de qué proceso termina antes. Espera a que
+    acabe la primera fase.
+    """
+    if service_url or not calibration_db:
+        return {
+            p: pool.submit(process_run, p, output_dir, multiplicador, calibration_db, lot, archive_dir,
+                           own_curve, rules_file, timings, service_url, ct_calling)
+            for p in paths
+        }
+    analyses = {p: pool.submit(analyze_and_save, p, calibration_db, lot, timings, ct_calling) for p in paths}
+    wait(analyses.values())
+    results, runs = {}, {}
+    for p, fut in analyses.items():
+        if fut.exception() is None:
+            runs[p] = fut.result()
+        else:
+            results[p] = fut
+    for p in sorted(runs, key=lambda p: runs[p].run_date or ""):
+        results[p] = pool.submit(finish_run, p, runs[p], output_dir, multiplicador, calibration_db, lot,
+                                 archive_dir, own_curve, rules_file, timings, ct_calling)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Procesa por lotes exports de PCR (.xls/.xlsx/.txt).")
+    parser.add_argument("inputs", nargs="+", help="Archivos o directorios con los exports")
+    parser.add_argument("-o", "--output", default="resultados", help="Directorio de salida")
+    parser.add_argument("-m", "--multiplicador", type=int, choices=[100, 10000], default=100)
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+                        help="Procesos en paralelo (por defecto, nº de CPUs)")
+    parser.add_argument("--calibraciones", help="Biblioteca de calibraciones (SQLite) a usar y actualizar")
+    parser.add_argument("--lote", default="", help="Lote de calibrador de los runs")
+    parser.add_argument("--archivo", help="Directorio del archivo Parquet de resultados al que añadir los runs")
+    parser.add_argument("--recta-propia", action="store_true",
+                        help="Recalcular la Quantity de cada pocillo con las rectas del run")
+    parser.add_argument("--reglas", help="Archivo JSON de reglas de interpretación MR por target")
+    parser.add_argument("--tiempos", action="store_true",
+                        help="Registrar en stderr (JSON por línea) el tiempo y la memoria de cada etapa")
+    parser.add_argument("--servicio", default=SERVICE_URL or None,
+                        help="URL del servicio de análisis (por defecto PCR_SERVICE_URL); sin ella se calcula aquí")
+    parser.add_argument("--ct-propio", nargs="?", const="auto", metavar="UMBRAL",
+                        help="Calcular el Ct desde los datos de amplificación, con ese umbral de ΔRn "
+                             "(0 o sin valor: automático)")
+    parser.add_argument("--linea-base", default="3-15", metavar="INICIO-FIN",
+                        help="Ciclos de la línea base para --ct-propio (por defecto 3-15)")
+    args = parser.parse_args(argv)
+
+    ct_calling = None
+    if args.ct_propio:
+        try:
+            start, end = map(int, args.linea_base.split("-"))
+            # 0 es automático, como en la app
+            threshold = None if args.ct_propio == "auto" else float(args.ct_propio) or None
+            ct_calling = CtCalling(threshold, start, end)
+        except ValueError as exc:
+            parser.error(f"--ct-propio espera un umbral positivo, 0 o 'auto' y --linea-base, INICIO-FIN ({exc})")
+
+    files = collect_inputs(args.inputs)
+    if not files:
+        parser.error("no se encontraron exports (.xls/.xlsx/.txt)")
+    os.makedirs(args.output, exist_ok=True)
+
+    if args.tiempos:
+        configure_logging()
+    results, errores = {}, 0
+    with ProcessPoolExecutor(
+        max_workers=args.workers, initializer=configure_logging if args.tiempos else None
+    ) as pool:
+        futures = {
+            fut: f
+            for f, fut in process_runs(
+                pool, files, args.output, args.multiplicador, args.calibraciones, args.lote, args.archivo,
+                args.recta_propia, args.reglas, args.tiempos, args.servicio, ct_calling,
+            ).items()
+        }
+        for fut in as_completed(futures):
+            f = futures[fut]
+            try:
+                results[f] = fut.result()
+            except Exception as exc:
+                errores += 1
+                print(f"ERROR {f}: {exc}", file=sys.stderr)
+                continue
+            for aviso in results[f][2]:
+                print(f"AVISO {f.name}: {aviso}", file=sys.stderr)
+            print(f"OK {f.name}")
+
+    # Tabla combinada en el orden de entrada, con el run de origen de cada fila
+    ordered = [f for f in files if f in results]
+    if ordered:
+        combined = Path(args.output) / "resumen_combinado.xlsx"
+        write_workbook({
+            sheet: pd.concat([results[f][idx].assign(Run=f.stem) for f in ordered], ignore_index=True)
+            for idx, sheet in enumerate(["Quantity", "ΔCt"])
+        }, combined)
+        print(f"Tabla combinada: {combined}")
+
+    return 1 if errores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
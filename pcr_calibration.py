@@ -0,0 +1,148 @@
+# pcr_calibration.py
+# Biblioteca local de calibraciones: rectas y factores por par guardados en SQLite
+import json
+import os
+import sqlite3
+from dataclasses import replace
+
+# Ruta por defecto de la biblioteca (se puede cambiar con PCR_CALIBRATION_DB)
+DEFAULT_DB = os.environ.get("PCR_CALIBRATION_DB", "calibraciones.sqlite")
+# Por debajo de este R² la recta del run se considera fallida
+MIN_R2 = 0.98
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS curves (
+    id INTEGER PRIMARY KEY,
+    target TEXT NOT NULL,
+    plate_date TEXT NOT NULL,
+    lot TEXT NOT NULL,
+    a REAL NOT NULL,
+    b REAL NOT NULL,
+    r2 REAL,
+    efficiency REAL,
+    x_vals TEXT NOT NULL,
+    y_vals TEXT NOT NULL,
+    UNIQUE (target, plate_date, lot)
+);
+CREATE INDEX IF NOT EXISTS curves_lookup ON curves (target, lot, plate_date);
+CREATE TABLE IF NOT EXISTS pair_factors (
+    curve_id INTEGER NOT NULL REFERENCES curves (id) ON DELETE CASCADE,
+    quantity REAL NOT NULL,
+    factor REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pair_factors_curve ON pair_factors (curve_id);
+"""
+
+
+class CalibrationStore:
+    """Rectas estándar por target, fecha de placa y lote de calibrador."""
+
+    def __init__(self, path=DEFAULT_DB):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=30)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    def save_run(self, run, lot="", min_r2=MIN_R2):
+        """Guarda las rectas ajustadas en el propio run (no las reutilizadas ni las fallidas).
+
+        Una recta fallida borra la que hubiera guardada del mismo target, fecha
+        y lote, para que volver a analizar el run no la reutilice.
+        """
+        plate_date = run.run_date or ""
+        with self._conn:
+            for target, reg in run.regression.items():
+                if run.curve_source.get(target) != "run":
+                    continue
+                self._conn.execute(
+                    "DELETE FROM curves WHERE target = ? AND plate_date = ? AND lot = ?",
+                    (target, plate_date, lot),
+                )
+                if not reg["r2"] >= min_r2:
+                    continue
+                cur = self._conn.execute(
+                    "INSERT INTO curves (target, plate_date, lot, a, b, r2, efficiency, x_vals, y_vals)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (target, plate_date, lot, float(reg["a"]), float(reg["b"]),
+                     float(reg["r2"]), float(reg["efficiency"]),
+                     json.dumps(list(map(float, reg["x_vals"]))), json.dumps(list(map(float, reg["y_vals"])))),
+                )
+                self._conn.executemany(
+                    "INSERT INTO pair_factors (curve_id, quantity, factor) VALUES (?, ?, ?)",
+                    [(cur.lastrowid, float(pf["Quantity"]), float(pf["Factor"]))
+                     for pf in run.pair_factors.get(target, [])],
+                )
+
+    def find(self, target, lot=None, before=None, exclude_date=None, min_r2=MIN_R2):
+        """Recta válida más reciente de `target` (del lote y hasta la fecha dados, si se indican).
+
+        Sólo se consideran rectas con R² >= `min_r2`; con `exclude_date` se
+        descarta la guardada de esa fecha y lote (la del propio run).
+        Devuelve `(regression, pair_factors, descripción)` o None.
+        """
+        sql = ("SELECT id, plate_date, lot, a, b, r2, efficiency, x_vals, y_vals FROM curves"
+               " WHERE target = ? AND r2 >= ?")
+        params = [target, min_r2]
+        if lot:
+            sql += " AND lot = ?"
+            params.append(lot)
+        if before:
+            sql += " AND plate_date <= ?"
+            params.append(before)
+        if exclude_date is not None:
+            sql += " AND NOT (plate_date = ? AND lot = ?)"
+            params += [exclude_date, lot or ""]
+        row = self._conn.execute(sql + " ORDER BY plate_date DESC, id DESC LIMIT 1", params).fetchone()
+        if row is None:
+            return None
+        curve_id, plate_date, curve_lot, a, b, r2, efficiency, x_vals, y_vals = row
+        regression = {
+            "a": a, "b": b, "r2": r2, "efficiency": efficiency,
+            "x_vals": json.loads(x_vals), "y_vals": json.loads(y_vals),
+            "residuals": [],
+        }
+        pair_factors = [
+            {"Quantity": q, "Factor": f}
+            for q, f in self._conn.execute(
+                "SELECT quantity, factor FROM pair_factors WHERE curve_id = ? ORDER BY quantity", (curve_id,)
+            )
+        ]
+        source = f"biblioteca ({plate_date or 'sin fecha'}" + (f", lote {curve_lot})" if curve_lot else ")")
+        return regression, pair_factors, source
+
+    def reuse_missing(self, run, lot=None, min_r2=MIN_R2):
+        """Completa el run con rectas guardadas del mismo lote para los targets sin recta válida.
+
+        Un target necesita recta guardada si aparece en pacientes o estándares
+        y el run no tiene recta para él o su R² es menor que `min_r2`. Sin
+        lote no se reutiliza nada: una recta de otro lote no es comparable.
+        """
+        if not lot:
+            return run
+        targets = set(run.patients["Target Name"].dropna()) | set(run.standards["Target Name"].dropna())
+        failed = [
+            t for t in sorted(targets)
+            if t not in run.regression or not run.regression[t]["r2"] >= min_r2
+        ]
+        regression, pair_factors, curve_source = dict(run.regression), dict(run.pair_factors), dict(run.curve_source)
+        for target in failed:
+            stored = self.find(
+                target, lot=lot, before=run.run_date, exclude_date=run.run_date or "", min_r2=min_r2
+            )
+            if stored is None:
+                continue
+            reg, pfs, source = stored
+            reg["raw_points"] = run.standards[run.standards["Target Name"]==target]
+            regression[target], pair_factors[target], curve_source[target] = reg, pfs, source
+        if curve_source == run.curve_source:
+            return run
+        return replace(run, regression=regression, pair_factors=pair_factors, curve_source=curve_source)
@@ -0,0 +1,110 @@
+# pcr_charts.py
+# Especificaciones Vega-Lite de las curvas estándar, dibujadas en el navegador
+import math
+
+
+def _value(v):
+    # NaN -> null para que el JSON sea válido en el navegador
+    v = float(v)
+    return None if math.isnan(v) else round(v, 4)
+
+
+def standard_curves_data(regression_dict, pair_factors_dict=None):
+    """Filas de datos de las curvas: pocillos, recta ajustada y puntos de cada par.
+
+    Cada fila lleva `capa` ("pocillo", "recta" o "par") para que las capas
+    del gráfico filtren la misma tabla en lugar de repetir datos.
+    """
+    pair_factors_dict = pair_factors_dict or {}
+    rows = []
+    for target, reg in regression_dict.items():
+        raw = reg["raw_points"]
+        raw = raw[raw["Quantity"] > 0]
+        for well, q, ct in zip(raw["Well"], raw["Quantity"], raw["Cт"]):
+            rows.append({"capa": "pocillo", "Target": target, "Pocillo": well, "Quantity": _value(q),
+                         "log10(Quantity)": _value(math.log10(q)), "Ct": _value(ct)})
+        if reg["x_vals"]:
+            for x in (min(reg["x_vals"]), max(reg["x_vals"])):
+                rows.append({"capa": "recta", "Target": target, "log10(Quantity)": _value(x),
+                             "Ct": _value(reg["a"] * x + reg["b"])})
+        factors = {round(math.log10(pf["Quantity"]), 6): pf["Factor"] for pf in pair_factors_dict.get(target, [])}
+        for x, y, res in zip(reg["x_vals"], reg["y_vals"], reg.get("residuals", [])):
+            rows.append({"capa": "par", "Target": target, "Quantity": _value(10 ** x),
+                         "log10(Quantity)": _value(x), "Ct": _value(y), "Residuo": _value(res),
+                         "Factor": _value(factors.get(round(x, 6), math.nan))})
+    return rows
+
+
+def standard_curves_spec(regression_dict, pair_factors_dict=None):
+    """Gráfico Vega-Lite: rectas con pocillos y pares arriba, residuos abajo.
+
+    Al pasar el ratón por un pocillo se ve su nombre, Quantity y Ct; por un
+    par, su Ct medio, residuo y factor de conversión.
+    """
+    x = {"field": "log10(Quantity)", "type": "quantitative"}
+    color = {"field": "Target", "type": "nominal"}
+
+    def only(capa):
+        return {"filter": {"field": "capa", "equal": capa}}
+
+    return {
+        "$schema": "https://vega.github.io/schema/vega-lite/v5.json",
+        "data": {"values": standard_curves_data(regression_dict, pair_factors_dict)},
+        "vconcat": [
+            {
+                "title": "Curvas patrón de cada Target",
+                "height": 320,
+                "layer": [
+                    {
+                        "transform": [only("recta")],
+                        "mark": "line",
+                        "encoding": {"x": x, "y": {"field": "Ct", "type": "quantitative"}, "color": color},
+                    },
+                    {
+                        "transform": [only("pocillo")],
+                        "mark": {"type": "point", "filled": True, "size": 30, "opacity": 0.7},
+                        "encoding": {
+                            "x": x, "y": {"field": "Ct", "type": "quantitative", "scale": {"zero": False}},
+                            "color": color,
+                            "tooltip": [
+                                {"field": "Pocillo"}, {"field": "Target"},
+                                {"field": "Quantity", "type": "quantitative"},
+                                {"field": "Ct", "type": "quantitative", "format": ".3f"},
+                            ],
+                        },
+                    },
+                    {
+                        "transform": [only("par")],
+                        "mark": {"type": "point", "size": 90, "strokeWidth": 1.5},
+                        "encoding": {
+                            "x": x, "y": {"field": "Ct", "type": "quantitative"}, "color": color,
+                            "tooltip": [
+                                {"field": "Target"}, {"field": "Quantity", "type": "quantitative"},
+                                {"field": "Ct", "type": "quantitative", "format": ".3f", "title": "Ct medio"},
+                                {"field": "Residuo", "type": "quantitative", "format": ".3f"},
+                                {"field": "Factor", "type": "quantitative", "title": "Factor de conversión"},
+                            ],
+                        },
+                    },
+                ],
+            },
+            {
+                "title": "Residuos",
+                "height": 120,
+                "transform": [only("par")],
+                "layer": [
+                    {"mark": {"type": "rule", "color": "gray", "strokeDash": [4, 4]}, "encoding": {"y": {"datum": 0}}},
+                    {
+                        "mark": {"type": "point", "filled": True},
+                        "encoding": {
+                            "x": x, "y": {"field": "Residuo", "type": "quantitative"}, "color": color,
+                            "tooltip": [
+                                {"field": "Target"}, {"field": "Quantity", "type": "quantitative"},
+                                {"field": "Residuo", "type": "quantitative", "format": ".3f"},
+                            ],
+                        },
+                    },
+                ],
+            },
+        ],
+    }
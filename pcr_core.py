@@ -0,0 +1,399 @@
+# pcr_core.py
+# Cálculo del análisis de PCR sin dependencias de interfaz (Streamlit/matplotlib)
+from dataclasses import dataclass, field
+
+import pandas as pd
+import numpy as np
+
+from pcr_reader import read_results
+from pcr_rules import default_rules
+
+
+@dataclass
+class StandardWarning:
+    """Aviso de Ct 'Undetermined' en un punto de la curva estándar."""
+    target: str
+    quantity: float
+    n_undetermined: int
+
+    @property
+    def message(self):
+        if self.n_undetermined == 1:
+            return f"{self.target}, Quantity {self.quantity}: 1 Ct de 2 está 'Undetermined'"
+        return f"{self.target}, Quantity {self.quantity}: Ambos Ct están 'Undetermined'"
+
+
+@dataclass
+class RunAnalysis:
+    """Resultado de analizar un run: pacientes, estándares, rectas y factores."""
+    patients: pd.DataFrame
+    standards: pd.DataFrame
+    regression: dict = field(default_factory=dict)
+    pair_factors: dict = field(default_factory=dict)
+    warnings: list = field(default_factory=list)
+    metadata: dict = field(default_factory=dict)
+    # Origen de cada recta: "run" o la calibración de biblioteca reutilizada
+    curve_source: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.factor_index = FactorIndex(self.pair_factors)
+        for target in self.regression:
+            self.curve_source.setdefault(target, "run")
+
+    @property
+    def run_date(self):
+        """Fecha del run (AAAA-MM-DD) según 'Experiment Run End Time', o None."""
+        end_time = self.metadata.get("Experiment Run End Time", "")
+        return end_time[:10] if len(end_time) >= 10 and end_time[4] == "-" else None
+
+    def summarize(self, multiplicador, own_curve=False, rules=None):
+        """Tablas resumen; con `own_curve` las Quantity salen de las rectas del run."""
+        patients = requantify_patients(self.patients, self.regression) if own_curve else self.patients
+        return summarize_patients(patients, self.factor_index, multiplicador, rules)
+
+
+def read_run(source):
+    """Lee el export del equipo (ruta, bytes u objeto tipo archivo)."""
+    return read_results(source)
+
+
+def _task_rows(df, task):
+    # Con la tabla agrupada por Task (read_results), cada tarea es un tramo
+    # contiguo y el subconjunto es una vista, no una copia.
+    codes = df["Task"].cat.codes.to_numpy()
+    code = df["Task"].cat.categories.get_indexer([task])[0]
+    if code < 0:
+        return df.iloc[:0]
+    return df.iloc[np.searchsorted(codes, code, side="left"):np.searchsorted(codes, code, side="right")]
+
+
+def split_tasks(df):
+    """Separa pacientes (UNKNOWN) y estándares (STANDARD).
+
+    Las columnas ya vienen tipadas desde `read_results`; si la tabla está
+    agrupada por Task, ambos subconjuntos son vistas de ella.
+    """
+    task = df["Task"]
+    if isinstance(task.dtype, pd.CategoricalDtype) and task.cat.codes.is_monotonic_increasing:
+        return _task_rows(df, "UNKNOWN"), _task_rows(df, "STANDARD")
+    return df[task=="UNKNOWN"], df[task=="STANDARD"]
+
+
+def recompute_replicate_means(df_patients, excluded_wells):
+    """Quita pocillos de pacientes y recalcula las medias de sus réplicas.
+
+    Sólo se recalculan "Quantity Mean" y "Cт Mean" de los pares
+    paciente/target afectados; el resto conserva los valores del equipo.
+    """
+    hit = df_patients["Well"].isin(excluded_wells)
+    if not hit.any():
+        return df_patients
+    key = ["Sample Name", "Target Name"]
+    affected = df_patients.loc[hit, key].drop_duplicates()
+    kept = df_patients[~hit].copy()
+    mask = pd.MultiIndex.from_frame(kept[key]).isin(pd.MultiIndex.from_frame(affected))
+    grouped = kept[mask].groupby(key, dropna=False, observed=True)
+    kept.loc[mask, "Quantity Mean"] = grouped["Quantity"].transform("mean")
+    kept.loc[mask, "Cт Mean"] = grouped["Cт"].transform("mean")
+    return kept
+
+
+def requantify_patients(df_patients, regression_dict):
+    """Recalcula la Quantity de cada pocillo con la recta del run y agrega sus réplicas.
+
+    Quantity = 10^((Ct - b) / a) en una sola pasada para todos los pocillos;
+    los targets sin recta conservan la Quantity del equipo. "Quantity Mean" y
+    "Cт Mean" se recalculan por paciente/target a partir de los pocillos
+    presentes.
+    """
+    targets = pd.Index(list(regression_dict))
+    code = targets.get_indexer(df_patients["Target Name"])
+    slope = np.array([reg["a"] for reg in regression_dict.values()] + [np.nan])[code]
+    intercept = np.array([reg["b"] for reg in regression_dict.values()] + [np.nan])[code]
+    ct = df_patients["Cт"].to_numpy(dtype=float)
+    quantity = np.where(code >= 0, 10 ** ((ct - intercept) / slope), df_patients["Quantity"].to_numpy(dtype=float))
+
+    out = df_patients.assign(Quantity=quantity)
+    grouped = out.groupby(["Sample Name", "Target Name"], sort=False, dropna=False, observed=True)
+    return out.assign(**{
+        "Quantity Mean": grouped["Quantity"].transform("mean"),
+        "Cт Mean": grouped["Cт"].transform("mean"),
+    })
+
+
+def _segment_sums(values, starts):
+    return np.add.reduceat(values, starts) if len(values) else np.zeros(0)
+
+
+def fit_standards(df_standard):
+    """Rectas de regresión y factores de conversión por par de cada target.
+
+    Todas las rectas se ajustan a la vez por mínimos cuadrados en forma
+    cerrada: los puntos (media de Ct por dilución) se ordenan por target y
+    las sumas de cada recta salen de reducciones por segmentos. Además de
+    `a` y `b`, cada recta lleva R², eficiencia (10^(-1/a) - 1) y residuos.
+
+    Devuelve `(regression_dict, pair_factors_dict, warnings)`.
+    """
+    std = df_standard[df_standard["Target Name"].notna() & df_standard["Quantity"].notna()]
+    target_order = pd.Index(std["Target Name"].unique())
+    std = std.assign(code=target_order.get_indexer(std["Target Name"]))
+
+    # Un punto por dilución: media de los Ct determinados
+    points = (
+        std.groupby(["code", "Quantity"], sort=True)["Cт"]
+        .agg(["mean", "count", "size"])
+        .reset_index()
+    )
+    warnings = [
+        StandardWarning(target_order[row.code], row.Quantity, int(row.size - row.count))
+        for row in points[points["count"] < points["size"]].itertuples()
+    ]
+    points = points[points["count"] > 0]
+    # Sólo targets con al menos dos diluciones válidas tienen recta
+    n_points = points.groupby("code")["Quantity"].transform("size")
+    points = points[n_points > 1].reset_index(drop=True)
+
+    codes = points["code"].to_numpy()
+    x = np.log10(points["Quantity"].to_numpy(dtype=float))
+    y = points["mean"].to_numpy(dtype=float)
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else np.zeros(0, dtype=int)
+
+    n = _segment_sums(np.ones_like(x), starts)
+    sx, sy = _segment_sums(x, starts), _segment_sums(y, starts)
+    sxx, sxy, syy = _segment_sums(x * x, starts), _segment_sums(x * y, starts), _segment_sums(y * y, starts)
+    slope = (n * sxy - sx * sy) / (n * sxx - sx * sx)
+    intercept = (sy - slope * sx) / n
+
+    seg = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(x)]))
+    residuals = y - (slope[seg] * x + intercept[seg])
+    ss_tot = syy - sy * sy / n
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r2 = 1 - _segment_sums(residuals ** 2, starts) / ss_tot
+    efficiency = 10 ** (-1 / slope) - 1
+
+    # Factor de cada par: Quantity nominal / media de las Quantity que da la recta
+    fit_codes = codes[starts]
+    fitted = std[std["code"].isin(fit_codes) & std["Cт"].notna()]
+    seg_of_code = pd.Series(np.arange(len(starts)), index=fit_codes)
+    well_seg = seg_of_code.loc[fitted["code"]].to_numpy()
+    expected = 10 ** ((fitted["Cт"].to_numpy() - intercept[well_seg]) / slope[well_seg])
+    expected_mean = (
+        pd.DataFrame({"code": fitted["code"].to_numpy(), "Quantity": fitted["Quantity"].to_numpy(), "e": expected})
+        .groupby(["code", "Quantity"], sort=True)["e"].mean()
+    )
+    factors = np.round(points["Quantity"].to_numpy() / expected_mean.to_numpy(), 2)
+
+    regression_dict = {}
+    pair_factors_dict = {}
+    for i, (lo, hi) in enumerate(zip(starts, np.r_[starts[1:], len(x)])):
+        target = target_order[codes[lo]]
+        regression_dict[target] = {
+            "a": slope[i], "b": intercept[i],
+            "r2": r2[i], "efficiency": efficiency[i],
+            "x_vals": x[lo:hi].tolist(), "y_vals": y[lo:hi].tolist(),
+            "residuals": residuals[lo:hi].tolist(),
+            "raw_points": df_standard[df_standard["Target Name"]==target],
+        }
+        pair_factors_dict[target] = [
+            {"Quantity": q, "Factor": f}
+            for q, f in zip(points["Quantity"].to_numpy()[lo:hi], factors[lo:hi])
+        ]
+
+    return regression_dict, pair_factors_dict, warnings
+
+
+def analyze_run(source, ct_calling=None):
+    """Lee un run y ajusta sus curvas estándar.
+
+    Con `ct_calling` (un `pcr_ct.CtCalling`), el Ct de cada pocillo se
+    recalcula a partir de los datos de amplificación del export.
+    """
+    df = read_run(source)
+    if ct_calling is not None:
+        from pcr_ct import apply_ct_calls
+        from pcr_reader import read_amplification
+
+        df = apply_ct_calls(df, read_amplification(source), ct_calling)
+    df_patients, df_standard = split_tasks(df)
+    regression_dict, pair_factors_dict, warnings = fit_standards(df_standard)
+    return RunAnalysis(
+        df_patients, df_standard, regression_dict, pair_factors_dict, warnings,
+        metadata=df.attrs.get("metadata", {}),
+    )
+
+
+def regression_table(regression_dict):
+    """Pendiente, intercepto, R² y eficiencia de cada target en forma de tabla."""
+    return pd.DataFrame(
+        [
+            {"Target": t, "a": reg["a"], "b": reg["b"], "R²": reg["r2"], "Eficiencia": reg["efficiency"]}
+            for t, reg in regression_dict.items()
+        ],
+        columns=["Target", "a", "b", "R²", "Eficiencia"],
+    )
+
+
+def factor_tables(pair_factors_dict):
+    """Tabla de factores de conversión por target, con los nombres de la app."""
+    return {
+        target: pd.DataFrame(pf_list).rename(columns={
+            "Quantity": "Quantity (par)",
+            "Factor": "Factor de Conversión"
+        })
+        for target, pf_list in pair_factors_dict.items() if pf_list
+    }
+
+
+class FactorIndex:
+    """Factores de conversión por target indexados por log10(Quantity).
+
+    Los pares de todos los targets se guardan en un único array ordenado
+    (cada target desplazado a su propio tramo), de modo que una sola llamada
+    a `searchsorted` resuelve el par más cercano de todas las consultas. Se
+    puede reutilizar entre runs que comparten lote de calibrador.
+    """
+
+    # Separación entre tramos de targets; holgada frente al rango de log10(Quantity)
+    _SPAN = 1000.0
+
+    def __init__(self, pair_factors_dict):
+        self.targets = pd.Index(list(pair_factors_dict))
+        log_q, factors, codes = [], [], []
+        for code, pf_list in enumerate(pair_factors_dict.values()):
+            pf_sorted = sorted(pf_list, key=lambda pf: pf["Quantity"])
+            log_q.extend(np.log10([pf["Quantity"] for pf in pf_sorted]))
+            factors.extend(pf["Factor"] for pf in pf_sorted)
+            codes.extend([code] * len(pf_sorted))
+        self.log_q = np.asarray(log_q, dtype=float)
+        self.factors = np.asarray(factors, dtype=float)
+        codes = np.asarray(codes, dtype=int)
+        self._keys = codes * self._SPAN + self.log_q
+        self._lo = np.searchsorted(codes, np.arange(len(self.targets)), side="left")
+        self._hi = np.searchsorted(codes, np.arange(len(self.targets)), side="right")
+
+    def lookup(self, targets, quantity_mean):
+        """Factor del par más cercano (en log10) a cada Quantity; 1 si no hay curva.
+
+        En caso de empate gana el par de menor Quantity.
+        """
+        quantity_mean = np.asarray(quantity_mean, dtype=float)
+        code = self.targets.get_indexer(pd.Index(np.asarray(targets, dtype=object)))
+        fc = np.ones(len(quantity_mean))
+        sel = np.flatnonzero((code >= 0) & (quantity_mean > 0))
+        if sel.size == 0:
+            return fc
+        code = code[sel]
+        log_q = np.log10(quantity_mean[sel])
+        lo, hi = self._lo[code], self._hi[code] - 1
+        right = np.clip(np.searchsorted(self._keys, code * self._SPAN + log_q), lo, hi)
+        left = np.maximum(right - 1, lo)
+        take_left = np.abs(self.log_q[left] - log_q) <= np.abs(self.log_q[right] - log_q)
+        fc[sel] = self.factors[np.where(take_left, left, right)]
+        return fc
+
+
+def conversion_factors(targets, quantity_mean, pair_factors):
+    """Factor del par estándar más cercano (en log10) a cada Quantity Mean.
+
+    `pair_factors` es un `FactorIndex` o el diccionario de factores por par.
+    Las posiciones sin curva o con Quantity no positiva reciben factor 1.
+    """
+    if not isinstance(pair_factors, FactorIndex):
+        pair_factors = FactorIndex(pair_factors)
+    return pair_factors.lookup(targets, quantity_mean)
+
+
+def interpret_mr(ratio, abl1_mean, extra, targets=None, rules=None):
+    """Interpretación MR para columnas completas de ratio y ABL1.
+
+    `rules` es un `MRRules` (por defecto, las del archivo de reglas); con
+    `targets` cada fila usa la regla de su target.
+    """
+    interpretacion = pd.Series((rules or default_rules()).interpret(targets, ratio, abl1_mean), dtype=object)
+    extra = pd.Series(np.asarray(extra, dtype=object))
+    return interpretacion.where(extra == "", interpretacion + " (" + extra + ")")
+
+
+def summarize_patients(df_patients, pair_factors, multiplicador, rules=None):
+    """Tablas resumen (Quantity/ABL1 y ΔCt) para todos los pares paciente/target.
+
+    Un único groupby agrega medias y positivos de cada par; el resto del
+    cálculo (ratios, factor de conversión, interpretación) es columnar.
+    `rules` son las reglas MR (`MRRules`); por defecto, las del archivo.
+    """
+    work = pd.DataFrame({
+        "Paciente": df_patients["Sample Name"],
+        "Target": df_patients["Target Name"],
+        "qm": df_patients["Quantity Mean"],
+        "ctm": df_patients["Cт Mean"],
+        "pos": df_patients["Quantity"].notna(),
+    })
+    agg = (
+        work.groupby(["Paciente", "Target"], sort=False, observed=True)
+        .agg(qm=("qm", "mean"), ctm=("ctm", "mean"), n_positive=("pos", "sum"), n_wells=("pos", "size"))
+        .reset_index()
+        .astype({"Paciente": object, "Target": object})
+    )
+
+    abl1 = agg[agg["Target"]=="ABL1"].set_index("Paciente")
+    pairs = agg[agg["Target"]!="ABL1"]
+    # Mismo orden que antes: pacientes por aparición y, dentro de cada uno, sus targets
+    patient_order = pd.Index(work["Paciente"].dropna().unique())
+    pairs = pairs.iloc[np.argsort(patient_order.get_indexer(pairs["Paciente"]), kind="stable")]
+    pairs = pairs.reset_index(drop=True)
+
+    patients = pairs["Paciente"]
+    targets = pairs["Target"].to_numpy()
+    quantity_mean = pairs["qm"].to_numpy(dtype=float)
+    target_ct_mean = pairs["ctm"].to_numpy(dtype=float)
+    n_positive = pairs["n_positive"].to_numpy()
+    n_wells = pairs["n_wells"].to_numpy()
+    abl1_mean = patients.map(abl1["qm"]).to_numpy(dtype=float)
+    abl1_ct_mean = patients.map(abl1["ctm"]).to_numpy(dtype=float)
+
+    # Los pocillos excluidos no cuentan: con 2 réplicas restantes, 2 positivos no es aviso
+    partial = ((n_positive == 1) | (n_positive == 2)) & (n_positive < n_wells)
+    aviso = np.where(
+        partial,
+        "Sólo " + pd.Series(n_positive).astype(str) + "/" + pd.Series(n_wells).astype(str) + " positivo",
+        "",
+    )
+    # Sólo se pide repetir cuando hay aviso: 1/1 positivo tras excluir réplicas no lo es
+    extra = np.where(partial & (n_positive == 1), "Repetir", "")
+
+    # TABLA 1: ratio Quantity/ABL1 corregido con el factor del par más cercano
+    valid = (quantity_mean > 0) & (abl1_mean > 0)
+    ratio = np.zeros(len(pairs))
+    ratio[valid] = quantity_mean[valid] / abl1_mean[valid] * multiplicador
+
+    fc = np.where(ratio > 0, conversion_factors(targets, quantity_mean, pair_factors), 1.0)
+    ratio *= fc
+
+    summary_df = pd.DataFrame({
+        "Interpretación": interpret_mr(ratio, abl1_mean, extra, targets, rules),
+        "Paciente": patients,
+        "Target": targets,
+        "Quantity Mean": np.round(quantity_mean, 1),
+        "ABL1 Mean": np.round(abl1_mean, 1),
+        "Ratio": np.round(ratio, 4),
+        "FC": np.round(fc, 2),
+        "Aviso": aviso,
+    }).sort_values("Ratio", kind="stable")
+
+    # TABLA 2: ratio 2^ΔCt
+    delta_ct = abl1_ct_mean - target_ct_mean
+    ratio_ct = np.where(np.isnan(delta_ct), 0.0, np.exp2(delta_ct) * multiplicador)
+
+    summary_ct_df = pd.DataFrame({
+        "Interpretación": interpret_mr(ratio_ct, abl1_mean, extra, targets, rules),
+        "Paciente": patients,
+        "Target": targets,
+        "Ct Mean Target": np.round(target_ct_mean, 2),
+        "Ct Mean ABL1": np.round(abl1_ct_mean, 2),
+        "ΔCt (ABL1-Target)": np.round(delta_ct, 2),
+        "Ratio (2^ΔCt)": np.round(ratio_ct, 4),
+        "Aviso": aviso,
+    }).sort_values("Ratio (2^ΔCt)", kind="stable")
+
+    return summary_df, summary_ct_df
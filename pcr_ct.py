@@ -0,0 +1,105 @@
+# pcr_ct.py
+# Ct propio a partir de los datos de amplificación (Rn por ciclo), para todos los pocillos a la vez
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# Umbral automático: veces la desviación típica mediana del ruido de la línea base
+AUTO_THRESHOLD_SDS = 10.0
+
+
+@dataclass(frozen=True)
+class CtCalling:
+    """Parámetros del cálculo de Ct; `threshold=None` calcula un umbral automático."""
+    threshold: float = None
+    baseline_start: int = 3
+    baseline_end: int = 15
+
+    def __post_init__(self):
+        if self.threshold is not None and not self.threshold > 0:
+            raise ValueError(f"El umbral de ΔRn debe ser positivo (o automático): {self.threshold}")
+        if not self.baseline_start < self.baseline_end:
+            raise ValueError(f"Línea base no válida: {self.baseline_start}-{self.baseline_end}")
+
+
+def amplification_matrix(amp):
+    """Pasa la tabla larga (Well, Cycle, Rn) a una matriz pocillos × ciclos."""
+    # Un único paso de hash por columna; el export viene ordenado por pocillo y ciclo
+    well_codes, wells = pd.factorize(amp["Well"])
+    cycles, cycle_codes = np.unique(amp["Cycle"].to_numpy(dtype=float), return_inverse=True)
+    rn = np.full((len(wells), len(cycles)), np.nan)
+    rn[well_codes, cycle_codes] = amp["Rn"]
+    return wells, cycles, rn
+
+
+def subtract_baseline(rn, cycles, start, end):
+    """ΔRn restando a cada pocillo su recta de línea base entre los ciclos `start` y `end`.
+
+    Las pendientes e interceptos de todos los pocillos salen en forma cerrada
+    sobre la matriz completa. Devuelve `(delta_rn, ruido)`, con el ruido como
+    desviación típica de los residuos de la línea base de cada pocillo.
+    """
+    sel = (cycles >= start) & (cycles <= end)
+    if sel.sum() < 2:
+        raise ValueError(f"La línea base ({start}-{end}) debe abarcar al menos dos ciclos")
+    x = cycles[sel]
+    y = rn[:, sel]
+    dx = x - x.mean()
+    y_mean = np.nanmean(y, axis=1)
+    slope = np.nansum(dx * (y - y_mean[:, None]), axis=1) / (dx * dx).sum()
+    intercept = y_mean - slope * x.mean()
+    noise = np.nanstd(y - (slope[:, None] * x + intercept[:, None]), axis=1)
+    return rn - (slope[:, None] * cycles + intercept[:, None]), noise
+
+
+def threshold_cycles(delta_rn, cycles, threshold, first_cycle=0):
+    """Ciclo (interpolado) en que cada pocillo cruza el umbral por primera vez; NaN si no lo cruza.
+
+    Sólo cuenta un cruce desde debajo del umbral: si el ciclo anterior (aunque
+    sea previo a `first_cycle`) ya lo supera, no hay tramo que interpolar.
+    """
+    above = delta_rn >= threshold
+    first = np.where(cycles < first_cycle, False, above).argmax(axis=1)
+    rows = np.arange(len(delta_rn))
+    valid = above[rows, first] & (cycles[first] >= first_cycle) & (first > 0)
+    valid &= delta_rn[rows, np.maximum(first - 1, 0)] < threshold
+    i = np.where(valid, first, 1)
+    y0, y1 = delta_rn[rows, i - 1], delta_rn[rows, i]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ct = cycles[i - 1] + (threshold - y0) / (y1 - y0) * (cycles[i] - cycles[i - 1])
+    return np.where(valid, ct, np.nan)
+
+
+def call_ct(amp, calling=CtCalling()):
+    """Ct de cada pocillo: línea base, umbral (fijo o automático) e interpolación.
+
+    Devuelve `(Series Ct indexada por Well, umbral usado)`.
+    """
+    wells, cycles, rn = amplification_matrix(amp)
+    delta_rn, noise = subtract_baseline(rn, cycles, calling.baseline_start, calling.baseline_end)
+    threshold = calling.threshold
+    if threshold is None:
+        threshold = AUTO_THRESHOLD_SDS * float(np.nanmedian(noise))
+    ct = threshold_cycles(delta_rn, cycles, threshold, first_cycle=calling.baseline_start)
+    return pd.Series(ct, index=wells, name="Cт"), threshold
+
+
+def apply_ct_calls(df, amp, calling=CtCalling()):
+    """Sustituye el Ct del equipo por el propio y recalcula las medias de réplicas.
+
+    Los pocillos sin datos de amplificación conservan el Ct del equipo. Las
+    Quantity de pacientes deben recalcularse después con las rectas del run
+    (`RunAnalysis.summarize(..., own_curve=True)`).
+    """
+    calls, threshold = call_ct(amp, calling)
+    own = df["Well"].map(calls)
+    out = df.assign(**{"Cт": own.where(df["Well"].isin(calls.index), df["Cт"]).astype(df["Cт"].dtype)})
+    # Réplicas: mismo paciente/target o, en estándares, misma dilución
+    replicate = out["Quantity"].where(out["Task"]=="STANDARD")
+    grouped = out.groupby(
+        [out["Sample Name"], out["Target Name"], out["Task"], replicate], dropna=False, observed=True, sort=False
+    )
+    out["Cт Mean"] = grouped["Cт"].transform("mean")
+    out.attrs = {**df.attrs, "ct_threshold": threshold}
+    return out
@@ -0,0 +1,82 @@
+# pcr_export.py
+# Exportación de resultados a un único libro Excel con openpyxl en modo write-only
+from io import BytesIO
+
+import pandas as pd
+
+from pcr_core import regression_table
+
+
+def _rows(df):
+    # NaN/None -> celda vacía; tipos NumPy -> tipos de Python
+    yield list(df.columns)
+    for row in df.astype(object).where(df.notna(), None).itertuples(index=False):
+        yield [v.item() if hasattr(v, "item") else v for v in row]
+
+
+def write_workbook(sheets, target=None):
+    """Escribe `{nombre de hoja: DataFrame}` fila a fila en modo write-only.
+
+    `target` es una ruta o un objeto tipo archivo; sin él se devuelven los bytes.
+    """
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    for name, df in sheets.items():
+        ws = wb.create_sheet(title=name[:31])
+        for row in _rows(df):
+            ws.append(row)
+    if target is not None:
+        wb.save(target)
+        return target
+    buf = BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def result_sheets(run, summary_df, summary_ct_df):
+    """Hojas del libro de resultados de un run."""
+    factors = pd.DataFrame(
+        [
+            {"Target": target, "Quantity (par)": pf["Quantity"], "Factor de Conversión": pf["Factor"]}
+            for target, pf_list in run.pair_factors.items() for pf in pf_list
+        ],
+        columns=["Target", "Quantity (par)", "Factor de Conversión"],
+    )
+    regression = regression_table(run.regression)
+    regression["Origen"] = regression["Target"].map(run.curve_source)
+    warnings = pd.DataFrame(
+        [
+            {"Target": w.target, "Quantity": w.quantity, "Undetermined": w.n_undetermined, "Aviso": w.message}
+            for w in run.warnings
+        ],
+        columns=["Target", "Quantity", "Undetermined", "Aviso"],
+    )
+    return {
+        "Quantity": summary_df,
+        "ΔCt": summary_ct_df,
+        "Regresión": regression,
+        "Factores": factors,
+        "Avisos": warnings,
+    }
+
+
+def export_run(run, summary_df, summary_ct_df, target=None):
+    """Libro con tablas resumen, rectas, factores de conversión y avisos."""
+    return write_workbook(result_sheets(run, summary_df, summary_ct_df), target)
+
+
+def export_runs(items, target=None):
+    """Libro de varios runs: `items` es una lista de (nombre, run, summary_df, summary_ct_df).
+
+    Con un solo run equivale a `export_run`; con varios, cada hoja reúne
+    las filas de todos los runs con una columna 'Run'.
+    """
+    if len(items) == 1:
+        _, run, summary_df, summary_ct_df = items[0]
+        return export_run(run, summary_df, summary_ct_df, target)
+    sheets = {}
+    for name, run, summary_df, summary_ct_df in items:
+        for sheet, df in result_sheets(run, summary_df, summary_ct_df).items():
+            sheets.setdefault(sheet, []).append(df.assign(Run=name))
+    return write_workbook({sheet: pd.concat(dfs, ignore_index=True) for sheet, dfs in sheets.items()}, target)
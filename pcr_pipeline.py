@@ -0,0 +1,181 @@
+# pcr_pipeline.py
+# Grafo de etapas del análisis con caché por nodo e invalidación incremental
+import hashlib
+
+import pandas as pd
+
+from pcr_core import RunAnalysis, fit_standards, read_run, recompute_replicate_means, split_tasks
+from pcr_timing import stage
+
+
+def _fingerprint(value):
+    # Las entradas se comparan por valor; los bytes (archivo) por su hash
+    if isinstance(value, (bytes, bytearray)):
+        return hashlib.sha256(value).hexdigest()
+    return value
+
+
+def frames_equal(a, b):
+    return a.shape == b.shape and a.equals(b)
+
+
+class Pipeline:
+    """Grafo de nodos que sólo recalcula lo que depende de entradas cambiadas.
+
+    Cada nodo guarda su salida junto con las versiones de sus dependencias.
+    Un nodo sólo se recalcula si alguna ha cambiado y, si su nueva salida es
+    igual a la anterior (según `same`), no invalida a los nodos siguientes.
+    Con `stage_log` (un `StageLog`), cada nodo recalculado queda registrado
+    con su tiempo y memoria bajo la etiqueta `label`.
+    """
+
+    def __init__(self):
+        self._inputs = {}      # nombre -> (huella, valor)
+        self._nodes = {}       # nombre -> (func, deps, same)
+        self._versions = {}    # nombre -> versión de su valor actual
+        self._cache = {}       # nombre -> (versiones de deps, valor)
+        self.last_computed = []
+        self.stage_log = None
+        self.label = ""
+
+    def add_input(self, name, value=None):
+        self._inputs[name] = (_fingerprint(value), value)
+        self._versions[name] = 0
+
+    def add_node(self, name, func, deps, same=None):
+        """`func` recibe los valores de `deps` (entradas o nodos) en orden."""
+        self._nodes[name] = (func, tuple(deps), same)
+        self._versions[name] = 0
+
+    def set(self, name, value):
+        """Cambia una entrada; sólo cuenta como cambio si su huella es distinta."""
+        fingerprint = _fingerprint(value)
+        if self._inputs[name][0] != fingerprint:
+            self._inputs[name] = (fingerprint, value)
+            self._versions[name] += 1
+
+    def get(self, name):
+        self.last_computed = []
+        return self._get(name)
+
+    def _get(self, name):
+        if name in self._inputs:
+            return self._inputs[name][1]
+        func, deps, same = self._nodes[name]
+        values = [self._get(dep) for dep in deps]
+        key = tuple(self._versions[dep] for dep in deps)
+        cached = self._cache.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        with stage(self.stage_log, name, self.label):
+            value = func(*values)
+        self.last_computed.append(name)
+        if cached is not None and same is not None and same(cached[1], value):
+            value = cached[1]
+        else:
+            self._versions[name] += 1
+        self._cache[name] = (key, value)
+        return value
+
+
+class _IncrementalFit:
+    """Ajuste de rectas que sólo rehace los targets cuyos pocillos estándar cambian."""
+
+    def __init__(self):
+        self._memo = {}  # target -> (huella de sus pocillos, recta, factores, avisos)
+
+    @staticmethod
+    def _target_key(df):
+        return pd.util.hash_pandas_object(df[["Well", "Quantity", "Cт"]], index=False).sum()
+
+    def __call__(self, df_standard):
+        targets = list(df_standard["Target Name"].dropna().unique())
+        groups = {t: df for t, df in df_standard.groupby("Target Name", sort=False, observed=True)}
+        keys = {t: self._target_key(groups[t]) for t in targets}
+        changed = [t for t in targets if self._memo.get(t, (None,))[0] != keys[t]]
+        if changed:
+            subset = df_standard[df_standard["Target Name"].isin(changed)]
+            regression, pair_factors, warnings = fit_standards(subset)
+            for t in changed:
+                self._memo[t] = (
+                    keys[t], regression.get(t), pair_factors.get(t),
+                    [w for w in warnings if w.target == t],
+                )
+        regression, pair_factors, warnings = {}, {}, []
+        for t in targets:
+            _, reg, pfs, warns = self._memo[t]
+            if reg is not None:
+                regression[t], pair_factors[t] = reg, pfs
+            warnings.extend(warns)
+        self.refitted = changed
+        return regression, pair_factors, warnings
+
+
+def run_pipeline(parse=read_run, reuse_curves=None):
+    """Grafo de un run: archivo -> pocillos -> rectas -> run -> tablas resumen.
+
+    Entradas: `file_bytes`, `excluded_wells` (frozenset de pocillos), `lot`,
+    `multiplicador`, `own_curve` (Quantity recalculada con las rectas del
+    run) y `ct_calling` (`CtCalling` para calcular el Ct desde los datos de
+    amplificación; implica `own_curve`). `parse` lee el archivo (p. ej. una versión con caché) y
+    `reuse_curves(run, lot)` completa rectas ausentes desde la biblioteca.
+    Los datos de amplificación se leen una sola vez por archivo, aunque
+    cambien el umbral o la línea base del Ct propio.
+    Cambiar el multiplicador sólo recalcula las tablas; excluir un pocillo
+    estándar sólo reajusta su target, y uno de paciente sólo recalcula las
+    medias de sus réplicas.
+    """
+    p = Pipeline()
+    p.add_input("file_bytes")
+    p.add_input("excluded_wells", frozenset())
+    p.add_input("lot", None)
+    p.add_input("multiplicador", 100)
+    p.add_input("own_curve", False)
+    p.add_input("ct_calling", None)
+
+    def amplification(data, needed):
+        if not needed:
+            return None
+        from pcr_reader import read_amplification
+
+        return read_amplification(data)
+
+    def calls(table, amp, ct_calling):
+        if ct_calling is None:
+            return table
+        from pcr_ct import apply_ct_calls
+
+        return apply_ct_calls(table, amp, ct_calling)
+
+    def patients(table, excluded):
+        return recompute_replicate_means(split_tasks(table)[0], excluded)
+
+    def standards(table, excluded):
+        std = split_tasks(table)[1]
+        return std[~std["Well"].isin(excluded)]
+
+    p.add_node("table", parse, ["file_bytes"])
+    # Los datos de amplificación se leen una vez por archivo: cambiar el umbral o la
+    # línea base no cambia `amplification_needed` y no vuelve a parsear el export
+    p.add_node("amplification_needed", lambda c: c is not None, ["ct_calling"], same=lambda a, b: a == b)
+    p.add_node("amplification", amplification, ["file_bytes", "amplification_needed"])
+    p.add_node("calls", calls, ["table", "amplification", "ct_calling"])
+    p.add_node("patients", patients, ["calls", "excluded_wells"], same=frames_equal)
+    p.add_node("standards", standards, ["calls", "excluded_wells"], same=frames_equal)
+    p.add_node("fit", _IncrementalFit(), ["standards"])
+    p.add_node(
+        "run",
+        lambda t, pts, std, fit: RunAnalysis(pts, std, *fit, metadata=t.attrs.get("metadata", {})),
+        ["table", "patients", "standards", "fit"],
+    )
+    p.add_node(
+        "calibrated",
+        (lambda run, lot: reuse_curves(run, lot)) if reuse_curves else (lambda run, lot: run),
+        ["run", "lot"],
+    )
+    p.add_node(
+        "summary",
+        lambda run, m, own, ct_calling: run.summarize(m, own or ct_calling is not None),
+        ["calibrated", "multiplicador", "own_curve", "ct_calling"],
+    )
+    return p
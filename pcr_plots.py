@@ -0,0 +1,58 @@
+# pcr_plots.py
+# Gráfico del seguimiento de paciente (matplotlib, PNG), separado del cálculo
+import matplotlib.pyplot as plt
+
+
+def figure_png(fig, dpi=100):
+    """Rasteriza la figura a PNG y la cierra."""
+    from io import BytesIO
+
+    try:
+        buf = BytesIO()
+        fig.savefig(buf, format="png", dpi=dpi, bbox_inches="tight")
+    finally:
+        plt.close(fig)
+    return buf.getvalue()
+
+
+def patient_trend_figure(history, target, rules=None, multiplicador=None):
+    """Evolución del ratio de un paciente en escala log con las bandas MR.
+
+    Las bandas salen de las reglas MR del target. Los runs con ratio 0
+    (indetectable) se marcan bajo la banda más baja. Sólo se dibujan los
+    runs de un multiplicador (por defecto, el del run más reciente), como
+    en la interpretación de las tablas.
+    """
+    from pcr_rules import default_rules
+
+    rule = (rules or default_rules()).for_target(target)
+    data = history[history["target"]==target].sort_values("run_date")
+    if multiplicador is None and len(data):
+        multiplicador = data["multiplicador"].iloc[-1]
+    if multiplicador is not None:
+        data = data[data["multiplicador"]==multiplicador]
+    floor = rule.ratio_limits.min() / 10
+
+    fig, ax = plt.subplots(figsize=(8,4))
+    limits = list(zip(rule.ratio_labels, rule.ratio_limits))
+    lower = floor / 10
+    for i, (label, upper) in enumerate(limits):
+        ax.axhspan(lower, upper, color=f"C{i}", alpha=0.08)
+        ax.axhline(upper, color=f"C{i}", lw=0.8, ls="--")
+        ax.text(1.01, upper, label, transform=ax.get_yaxis_transform(), va="center", fontsize=8)
+        lower = upper
+
+    detected = data["ratio"] > 0
+    ax.plot(data["run_date"], data["ratio"].where(detected, floor), color="k", lw=1)
+    ax.scatter(data.loc[detected, "run_date"], data.loc[detected, "ratio"], color="k", s=20, zorder=3)
+    ax.scatter(data.loc[~detected, "run_date"], [floor] * int((~detected).sum()),
+               marker="v", facecolors="none", edgecolors="k", s=30, zorder=3, label="Indetectable")
+    ax.set_yscale("log")
+    ax.set_ylim(floor / 10, max(1.0, data["ratio"].max() * 3))
+    ax.set_xlabel("Fecha del run")
+    ax.set_ylabel("Ratio" if multiplicador is None else f"Ratio (x{multiplicador})")
+    ax.set_title(f"{data['patient'].iloc[0] if len(data) else ''} - {target}")
+    if (~detected).any():
+        ax.legend(loc="upper right")
+    fig.autofmt_xdate()
+    return fig
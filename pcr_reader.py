@@ -0,0 +1,244 @@
+# pcr_reader.py
+# Lectura rápida del export de resultados del equipo (.xls, .xlsx o texto tabulado)
+from io import BytesIO, StringIO
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Columnas que usa el análisis; el resto del export se descarta al leer
+TEXT_COLUMNS = ["Well", "Sample Name", "Target Name", "Task"]
+# Columnas de texto con pocos valores distintos: se guardan como categóricas
+CATEGORY_COLUMNS = ["Sample Name", "Target Name", "Task"]
+NUMERIC_COLUMNS = ["Cт", "Cт Mean", "Quantity", "Quantity Mean"]
+RESULT_COLUMNS = TEXT_COLUMNS + NUMERIC_COLUMNS
+# Marcas de calidad del equipo; no todas las versiones del export las incluyen
+FLAG_COLUMNS = ["HIGHSD", "NOAMP"]
+
+# Variantes de cabecera según versión del software/idioma del export
+COLUMN_ALIASES = {
+    "CT": "Cт", "Ct": "Cт",
+    "CT Mean": "Cт Mean", "Ct Mean": "Cт Mean",
+}
+
+# Datos de amplificación (hoja "Amplification Data" o sección "[Amplification Data]")
+AMPLIFICATION_SHEET = "Amplification Data"
+AMPLIFICATION_COLUMNS = ["Well", "Cycle", "Rn"]
+
+# Filas de metadatos que se exploran como máximo buscando la cabecera
+MAX_HEADER_SCAN = 100
+
+_XLS_MAGIC = b"\xd0\xcf\x11\xe0"
+_XLSX_MAGIC = b"PK\x03\x04"
+
+
+def _read_bytes(source):
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if isinstance(source, (str, Path)):
+        return Path(source).read_bytes()
+    if hasattr(source, "getvalue"):
+        return source.getvalue()
+    return source.read()
+
+
+def _normalize_header(header):
+    return [COLUMN_ALIASES.get(str(h).strip(), str(h).strip()) for h in header]
+
+
+def _find_header(first_cells):
+    for i, cell in enumerate(first_cells):
+        if str(cell).strip() == "Well":
+            return i
+    raise ValueError("No se encuentra la fila de cabecera ('Well') en el archivo")
+
+
+def _label(value):
+    # Los nombres de muestra numéricos llegan como float (25797.0)
+    if value is None or value == "":
+        return None
+    if isinstance(value, float):
+        if np.isnan(value):
+            return None
+        if value.is_integer():
+            return str(int(value))
+    return str(value).strip()
+
+
+def _metadata(rows):
+    """Pares clave/valor de la cabecera del export ('Block Type', 'Experiment Run End Time'...)."""
+    meta = {}
+    for row in rows:
+        if not row or row[0] is None:
+            continue
+        key = str(row[0]).strip().lstrip("*").strip()
+        value = row[1] if len(row) > 1 else None
+        # El export de texto usa "* Clave = Valor" en una sola celda
+        if "=" in key and value in (None, ""):
+            key, value = (part.strip() for part in key.split("=", 1))
+        if key:
+            meta[key] = "" if value is None else str(value).strip()
+    return meta
+
+
+def _build_frame(header, columns, metadata=None):
+    """Monta el DataFrame compacto a partir de las columnas leídas por nombre.
+
+    Muestra, target, tarea y marcas son categóricas y Ct/Quantity float32.
+    Las filas quedan agrupadas por Task (manteniendo el orden del export
+    dentro de cada tarea) para que pacientes y estándares sean tramos
+    contiguos. Los metadatos de la cabecera quedan en `df.attrs["metadata"]`.
+    """
+    positions = {name: i for i, name in enumerate(_normalize_header(header))}
+    missing = [c for c in RESULT_COLUMNS if c not in positions]
+    if missing:
+        raise ValueError(f"Faltan columnas en el export: {', '.join(missing)}")
+
+    # Las etiquetas se limpian sobre los valores distintos, no celda a celda
+    data = {}
+    for name in TEXT_COLUMNS + [c for c in FLAG_COLUMNS if c in positions]:
+        codes, uniques = pd.factorize(np.asarray(columns(positions[name]), dtype=object))
+        labels = pd.Index([_label(v) for v in uniques], dtype=object)
+        if name == "Well":
+            data[name] = pd.Series(np.append(labels.to_numpy(), None)[codes], dtype=object)
+            continue
+        categories = labels.dropna().unique().sort_values()
+        codes = np.append(categories.get_indexer(labels), -1)[codes]
+        data[name] = pd.Categorical.from_codes(codes, categories=categories.astype(str))
+    for name in NUMERIC_COLUMNS:
+        # 'Undetermined' y celdas vacías pasan a NaN
+        values = np.asarray(columns(positions[name]), dtype=object)
+        data[name] = pd.to_numeric(values, errors="coerce").astype(np.float32)
+    df = pd.DataFrame(data)
+    df = df.iloc[np.argsort(df["Task"].cat.codes.to_numpy(), kind="stable")]
+    df.attrs["metadata"] = metadata or {}
+    return df
+
+
+def _read_xls(data):
+    import xlrd
+
+    book = xlrd.open_workbook(file_contents=data, on_demand=True)
+    sheet = book.sheet_by_name("Results") if "Results" in book.sheet_names() else book.sheet_by_index(0)
+    hdr = _find_header(sheet.col_values(0, 0, min(sheet.nrows, MAX_HEADER_SCAN)))
+    df = _build_frame(
+        sheet.row_values(hdr), lambda c: sheet.col_values(c, start_rowx=hdr + 1),
+        _metadata(sheet.row_values(r, 0, 2) for r in range(hdr)),
+    )
+    book.release_resources()
+    return df
+
+
+def _read_xlsx(data):
+    from io import BytesIO
+    from openpyxl import load_workbook
+
+    book = load_workbook(BytesIO(data), read_only=True, data_only=True)
+    sheet = book["Results"] if "Results" in book.sheetnames else book.worksheets[0]
+    rows = list(sheet.iter_rows(values_only=True))
+    book.close()
+    hdr = _find_header(r[0] if r else None for r in rows[:MAX_HEADER_SCAN])
+    body = rows[hdr + 1:]
+    return _build_frame(rows[hdr], lambda c: [r[c] if c < len(r) else None for r in body], _metadata(rows[:hdr]))
+
+
+def _read_text(data):
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = data.decode("latin-1")
+    # Los datos de amplificación, si vienen, no forman parte de la tabla de resultados
+    lines = text.partition(f"\n[{AMPLIFICATION_SHEET}]")[0].splitlines()
+    hdr = _find_header(line.split("\t", 1)[0] for line in lines[:MAX_HEADER_SCAN])
+    # La tabla de resultados termina en la primera línea vacía o sección "[...]"
+    end = hdr + 1
+    while end < len(lines) and lines[end].strip() and not lines[end].startswith("["):
+        end += 1
+    header = _normalize_header(lines[hdr].split("\t"))
+    table = pd.read_csv(
+        StringIO("\n".join(lines[hdr + 1:end])), sep="\t", header=None, names=header,
+        usecols=lambda c: c in RESULT_COLUMNS or c in FLAG_COLUMNS, dtype=str, keep_default_na=False,
+    )
+    return _build_frame(
+        list(table.columns), lambda c: table.iloc[:, c].tolist(),
+        _metadata(line.split("\t") for line in lines[:hdr]),
+    )
+
+
+def read_results(source):
+    """Lee la tabla de resultados del export con sólo las columnas necesarias.
+
+    Detecta el formato por contenido (.xls, .xlsx o texto tabulado) y la fila
+    de cabecera buscando 'Well'. Las columnas de Ct/Quantity salen como float
+    con 'Undetermined' convertido en NaN.
+    """
+    data = _read_bytes(source)
+    if data.startswith(_XLS_MAGIC):
+        return _read_xls(data)
+    if data.startswith(_XLSX_MAGIC):
+        return _read_xlsx(data)
+    return _read_text(data)
+
+
+def _amplification_frame(header, columns):
+    positions = {name: i for i, name in enumerate(_normalize_header(header))}
+    missing = [c for c in AMPLIFICATION_COLUMNS if c not in positions]
+    if missing:
+        raise ValueError(f"Faltan columnas en los datos de amplificación: {', '.join(missing)}")
+    return pd.DataFrame({
+        "Well": pd.Series([_label(v) for v in columns(positions["Well"])], dtype=object),
+        "Cycle": pd.to_numeric(pd.Series(columns(positions["Cycle"]), dtype=object), errors="coerce"),
+        "Rn": pd.to_numeric(pd.Series(columns(positions["Rn"]), dtype=object), errors="coerce").astype("float32"),
+    }).dropna(subset=["Well", "Cycle"])
+
+
+def read_amplification(source):
+    """Lee los datos de amplificación (Rn por pocillo y ciclo) del export.
+
+    Devuelve una tabla larga con Well, Cycle y Rn. Lanza ValueError si el
+    export no incluye la hoja o sección "Amplification Data".
+    """
+    data = _read_bytes(source)
+    if data.startswith(_XLS_MAGIC):
+        import xlrd
+
+        book = xlrd.open_workbook(file_contents=data, on_demand=True)
+        if AMPLIFICATION_SHEET not in book.sheet_names():
+            raise ValueError("El export no incluye datos de amplificación")
+        sheet = book.sheet_by_name(AMPLIFICATION_SHEET)
+        hdr = _find_header(sheet.col_values(0, 0, min(sheet.nrows, MAX_HEADER_SCAN)))
+        df = _amplification_frame(sheet.row_values(hdr), lambda c: sheet.col_values(c, start_rowx=hdr + 1))
+        book.release_resources()
+        return df
+    if data.startswith(_XLSX_MAGIC):
+        from openpyxl import load_workbook
+
+        book = load_workbook(BytesIO(data), read_only=True, data_only=True)
+        if AMPLIFICATION_SHEET not in book.sheetnames:
+            book.close()
+            raise ValueError("El export no incluye datos de amplificación")
+        rows = list(book[AMPLIFICATION_SHEET].iter_rows(values_only=True))
+        book.close()
+        hdr = _find_header(r[0] if r else None for r in rows[:MAX_HEADER_SCAN])
+        body = rows[hdr + 1:]
+        return _amplification_frame(rows[hdr], lambda c: [r[c] if c < len(r) else None for r in body])
+
+    # Se busca la sección sobre los bytes, sin decodificar ni partir en líneas todo el export
+    marker = data.find(f"[{AMPLIFICATION_SHEET}]".encode())
+    if marker < 0:
+        raise ValueError("El export no incluye datos de amplificación")
+    body = data[data.index(b"\n", marker) + 1:]
+    # La sección termina en la primera línea vacía o en la siguiente sección "[...]"
+    ends = [i for i in (body.find(b"\n\n"), body.find(b"\n\r\n"), body.find(b"\n[")) if i >= 0]
+    table = pd.read_csv(
+        BytesIO(body[:min(ends)] if ends else body), sep="\t", dtype={"Well": str},
+        usecols=lambda c: c.strip() in AMPLIFICATION_COLUMNS, encoding_errors="replace",
+    ).rename(columns=str.strip)
+    missing = [c for c in AMPLIFICATION_COLUMNS if c not in table.columns]
+    if missing:
+        raise ValueError(f"Faltan columnas en los datos de amplificación: {', '.join(missing)}")
+    return pd.DataFrame({
+        "Well": table["Well"],
+        "Cycle": pd.to_numeric(table["Cycle"], errors="coerce"),
+        "Rn": pd.to_numeric(table["Rn"], errors="coerce").astype("float32"),
+    }).dropna(subset=["Well", "Cycle"])
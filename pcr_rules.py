@@ -0,0 +1,96 @@
+# pcr_rules.py
+# Reglas de interpretación MR por target, leídas de un JSON y compiladas a tramos
+import json
+import logging
+import os
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Archivo de reglas por defecto, junto a este módulo (se puede cambiar con PCR_MR_RULES)
+DEFAULT_RULES_FILE = Path(os.environ.get("PCR_MR_RULES") or Path(__file__).with_name("reglas_mr.json"))
+
+logger = logging.getLogger("pcr.reglas")
+
+# Reglas de BCR-ABL1 (IS); se usan si no hay archivo o un target no tiene reglas propias.
+#   abl1_min: por debajo, la muestra no es valorable.
+#   sin_ratio: ratio 0 -> tramos por ABL1 [límite superior (exclusivo), etiqueta].
+#   ratio: tramos por ratio [límite superior (inclusivo), etiqueta]; null = sin límite.
+DEFAULT_RULE = {
+    "abl1_min": 10000,
+    "no_valorable": "No valorable",
+    "sin_ratio": [[32000, "Al menos MR4"], [100000, "Al menos MR4.5"], [None, "Al menos MR5"]],
+    "ratio": [[0.001, "MR5"], [0.0032, "MR4.5"], [0.01, "MR4"], [0.1, "MR3"], [None, "Ausencia de MR"]],
+}
+
+
+class CompiledRule:
+    """Regla de un target como tramos ordenados, evaluable sobre columnas enteras."""
+
+    def __init__(self, spec):
+        spec = {**DEFAULT_RULE, **spec}
+        self.abl1_min = float(spec["abl1_min"])
+        self.no_valorable = spec["no_valorable"]
+        self.abl1_limits, self.abl1_labels = self._bins(spec["sin_ratio"])
+        self.ratio_limits, self.ratio_labels = self._bins(spec["ratio"])
+
+    @staticmethod
+    def _bins(pairs):
+        limits = [np.inf if lim is None else float(lim) for lim, _ in pairs]
+        if limits != sorted(limits) or limits[-1] != np.inf:
+            raise ValueError("Los tramos deben ir en orden creciente y terminar sin límite (null)")
+        return np.asarray(limits[:-1]), np.asarray([label for _, label in pairs], dtype=object)
+
+    def apply(self, ratio, abl1_mean):
+        # ratio <= límite: side="left"; ABL1 < límite: side="right"
+        by_ratio = self.ratio_labels[np.searchsorted(self.ratio_limits, ratio, side="left")]
+        by_abl1 = self.abl1_labels[np.searchsorted(self.abl1_limits, abl1_mean, side="right")]
+        labels = np.where(ratio == 0, by_abl1, by_ratio)
+        return np.where(abl1_mean < self.abl1_min, self.no_valorable, labels)
+
+
+class MRRules:
+    """Reglas MR por target (sin distinguir mayúsculas) con una regla por defecto."""
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.default = CompiledRule(config.get("default", {}))
+        self.by_target = {
+            str(t).upper(): CompiledRule({**config.get("default", {}), **spec})
+            for t, spec in config.get("targets", {}).items()
+        }
+
+    def for_target(self, target):
+        return self.by_target.get(str(target).upper(), self.default)
+
+    def interpret(self, targets, ratio, abl1_mean):
+        """Etiqueta MR de cada fila; una pasada vectorizada por regla distinta."""
+        ratio = np.asarray(ratio, dtype=float)
+        abl1_mean = np.asarray(abl1_mean, dtype=float)
+        out = self.default.apply(ratio, abl1_mean).astype(object)
+        if self.by_target and targets is not None:
+            keys = pd.Series(np.asarray(targets, dtype=object)).str.upper().to_numpy()
+            for key, rule in self.by_target.items():
+                sel = keys == key
+                if sel.any():
+                    out[sel] = rule.apply(ratio[sel], abl1_mean[sel])
+        return out
+
+
+def load_rules(path=None):
+    """Lee las reglas de `path` (o del archivo por defecto si existe)."""
+    path = Path(path or DEFAULT_RULES_FILE)
+    if not path.exists():
+        if path == DEFAULT_RULES_FILE:
+            logger.warning("No existe el archivo de reglas MR %s; se usan los umbrales internos", path)
+            return MRRules()
+        raise FileNotFoundError(f"No existe el archivo de reglas MR: {path}")
+    return MRRules(json.loads(path.read_text(encoding="utf-8")))
+
+
+@lru_cache(maxsize=None)
+def default_rules():
+    """Reglas del archivo por defecto, compiladas una sola vez por proceso."""
+    return load_rules()
@@ -0,0 +1,267 @@
+# pcr_service.py
+# Servicio HTTP/JSON local del análisis, con un pool acotado de procesos.
+#
+#   python pcr_service.py --puerto 8765 --workers 4
+#   curl --data-binary @"samples/20250812 p210.xls" "http://localhost:8765/analizar?multiplicador=100"
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError, URLError
+from urllib.parse import parse_qs, urlencode, urlparse
+from urllib.request import Request, urlopen
+
+import pandas as pd
+
+from pcr_core import RunAnalysis, StandardWarning
+
+# URL del servicio para la app y los lotes (si no se define, calculan en local)
+SERVICE_URL = os.environ.get("PCR_SERVICE_URL", "")
+DEFAULT_PORT = 8765
+# Peticiones en cola por proceso del pool antes de responder 503
+QUEUE_PER_WORKER = 2
+# Segundos máximos de espera de un análisis
+REQUEST_TIMEOUT = 300
+
+
+def _records(df):
+    # NaN -> null; categóricas y tipos NumPy -> tipos JSON
+    return json.loads(df.to_json(orient="records", force_ascii=False))
+
+
+def _number(value):
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+def run_to_json(run, summary_df, summary_ct_df):
+    """Run analizado y sus tablas resumen como diccionario serializable."""
+    return {
+        "metadata": run.metadata,
+        "regression": {
+            target: {
+                "a": _number(reg["a"]), "b": _number(reg["b"]),
+                "r2": _number(reg["r2"]), "efficiency": _number(reg["efficiency"]),
+                "x_vals": list(map(float, reg["x_vals"])), "y_vals": list(map(float, reg["y_vals"])),
+                "residuals": list(map(float, reg.get("residuals", []))),
+                "origen": run.curve_source.get(target, "run"),
+            }
+            for target, reg in run.regression.items()
+        },
+        "pair_factors": {
+            target: [{"Quantity": float(pf["Quantity"]), "Factor": float(pf["Factor"])} for pf in pf_list]
+            for target, pf_list in run.pair_factors.items()
+        },
+        "warnings": [
+            {"target": w.target, "quantity": float(w.quantity), "n_undetermined": w.n_undetermined,
+             "message": w.message}
+            for w in run.warnings
+        ],
+        "patients": _records(run.patients),
+        "standards": _records(run.standards),
+        "quantity": _records(summary_df),
+        "delta_ct": _records(summary_ct_df),
+    }
+
+
+def run_from_json(payload):
+    """Inverso de `run_to_json`: devuelve `(RunAnalysis, summary_df, summary_ct_df)`."""
+    patients = pd.DataFrame(payload["patients"])
+    standards = pd.DataFrame(payload["standards"])
+    regression, curve_source = {}, {}
+    for target, reg in payload["regression"].items():
+        curve_source[target] = reg.pop("origen")
+        regression[target] = {
+            **{k: (math.nan if v is None else v) for k, v in reg.items()},
+            "raw_points": standards[standards["Target Name"]==target] if len(standards) else standards,
+        }
+    run = RunAnalysis(
+        patients, standards, regression, payload["pair_factors"],
+        [StandardWarning(w["target"], w["quantity"], w["n_undetermined"]) for w in payload["warnings"]],
+        metadata=payload["metadata"], curve_source=curve_source,
+    )
+    return run, pd.DataFrame(payload["quantity"]), pd.DataFrame(payload["delta_ct"])
+
+
+def analyze_bytes(data, multiplicador=100, lot="", own_curve=False, excluded=(), calibration_db=None,
+                  ct_calling=None):
+    """Análisis completo de un export (se ejecuta en un proceso del pool)."""
+    from pcr_pipeline import run_pipeline
+
+    reuse = None
+    if calibration_db:
+        from pcr_calibration import CalibrationStore
+
+        def reuse(run, lot):
+            with CalibrationStore(calibration_db) as store:
+                return store.reuse_missing(run, lot=lot or None)
+
+    p = run_pipeline(reuse_curves=reuse)
+    p.set("file_bytes", data)
+    p.set("excluded_wells", frozenset(excluded))
+    p.set("lot", lot)
+    p.set("multiplicador", multiplicador)
+    p.set("own_curve", own_curve)
+    p.set("ct_calling", ct_calling)
+    summary_df, summary_ct_df = p.get("summary")
+    return run_to_json(p.get("calibrated"), summary_df, summary_ct_df)
+
+
+def _options(query):
+    q = {k: v[-1] for k, v in parse_qs(query).items()}
+    multiplicador = int(q.get("multiplicador", 100))
+    if multiplicador not in (100, 10000):
+        raise ValueError("multiplicador debe ser 100 o 10000")
+    ct_calling = None
+    if "ct" in q:
+        # Ct propio: ct=auto (o 0) o un umbral de ΔRn positivo; linea_base=inicio-fin (ciclos)
+        from pcr_ct import CtCalling
+
+        start, _, end = q.get("linea_base", "3-15").partition("-")
+        threshold = None if q["ct"] == "auto" else float(q["ct"]) or None
+        ct_calling = CtCalling(threshold, int(start), int(end))
+    return {
+        "multiplicador": multiplicador,
+        "lot": q.get("lote", ""),
+        "own_curve": q.get("recta_propia", "0") in ("1", "true", "si"),
+        "excluded": tuple(w for w in q.get("excluir", "").split(",") if w),
+        "ct_calling": ct_calling,
+    }
+
+
+class AnalysisServer(ThreadingHTTPServer):
+    """Servidor HTTP cuyos análisis se reparten en un pool de `workers` procesos.
+
+    Cada conexión se atiende en un hilo que sólo espera al pool, así que la
+    cola está acotada: con más de `workers * QUEUE_PER_WORKER` análisis en
+    curso se responde 503 en lugar de acumular trabajo.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, workers=None, calibration_db=None):
+        super().__init__(address, _Handler)
+        self.workers = workers or os.cpu_count()
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        self.slots = threading.BoundedSemaphore(self.workers * QUEUE_PER_WORKER)
+        self.calibration_db = calibration_db
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(cancel_futures=True)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def _reply(self, status, body):
+        data = json.dumps(body, ensure_ascii=False, allow_nan=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/salud":
+            return self._reply(200, {"ok": True, "workers": self.server.workers})
+        self._reply(404, {"error": "ruta desconocida"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/analizar":
+            return self._reply(404, {"error": "ruta desconocida"})
+        try:
+            options = _options(url.query)
+        except ValueError as exc:
+            return self._reply(400, {"error": str(exc)})
+        data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not data:
+            return self._reply(400, {"error": "el cuerpo debe contener el export del equipo"})
+        if not self.server.slots.acquire(blocking=False):
+            return self._reply(503, {"error": "servicio ocupado, reintentar más tarde"})
+        try:
+            future = self.server.pool.submit(
+                analyze_bytes, data, calibration_db=self.server.calibration_db, **options
+            )
+        except Exception as exc:
+            self.server.slots.release()
+            return self._reply(500, {"error": f"{type(exc).__name__}: {exc}"})
+        # El hueco se libera cuando el análisis acaba de verdad, no cuando se deja de esperarlo
+        future.add_done_callback(lambda _: self.server.slots.release())
+        try:
+            result = future.result(timeout=REQUEST_TIMEOUT)
+        except FutureTimeoutError:
+            future.cancel()
+            return self._reply(504, {"error": f"el análisis no terminó en {REQUEST_TIMEOUT} s"})
+        except ValueError as exc:
+            return self._reply(422, {"error": str(exc)})
+        except Exception as exc:
+            return self._reply(500, {"error": f"{type(exc).__name__}: {exc}"})
+        self._reply(200, result)
+
+    def log_message(self, format, *args):
+        sys.stderr.write(f"{self.address_string()} {format % args}\n")
+
+
+class ServiceClient:
+    """Cliente del servicio: envía un export y devuelve el run y sus tablas."""
+
+    def __init__(self, url=SERVICE_URL, timeout=REQUEST_TIMEOUT):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def analyze(self, data, multiplicador=100, lot="", own_curve=False, excluded=(), ct_calling=None):
+        """Devuelve `(RunAnalysis, summary_df, summary_ct_df)` calculados por el servicio."""
+        params = {
+            "multiplicador": multiplicador, "lote": lot or "",
+            "recta_propia": int(bool(own_curve)), "excluir": ",".join(sorted(excluded)),
+        }
+        if ct_calling is not None:
+            params["ct"] = "auto" if ct_calling.threshold is None else ct_calling.threshold
+            params["linea_base"] = f"{ct_calling.baseline_start}-{ct_calling.baseline_end}"
+        query = urlencode(params)
+        request = Request(
+            f"{self.url}/analizar?{query}", data=bytes(data),
+            headers={"Content-Type": "application/octet-stream"},
+        )
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                return run_from_json(json.load(response))
+        except HTTPError as exc:
+            try:
+                detail = json.load(exc).get("error", exc.reason)
+            except ValueError:
+                detail = exc.reason
+            raise RuntimeError(f"Servicio de análisis ({exc.code}): {detail}") from None
+        except (URLError, TimeoutError) as exc:
+            # Servicio caído, URL errónea o sin respuesta en `timeout` segundos
+            reason = getattr(exc, "reason", exc)
+            raise RuntimeError(f"Servicio de análisis no disponible en {self.url}: {reason}") from None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servicio HTTP/JSON local del análisis de PCR.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=DEFAULT_PORT)
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+                        help="Procesos de cálculo (por defecto, nº de CPUs)")
+    parser.add_argument("--calibraciones", help="Biblioteca de calibraciones (SQLite) para completar rectas")
+    args = parser.parse_args(argv)
+
+    server = AnalysisServer((args.host, args.puerto), args.workers, args.calibraciones)
+    print(f"Servicio en http://{args.host}:{args.puerto} ({server.workers} procesos)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
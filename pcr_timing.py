@@ -0,0 +1,92 @@
+# pcr_timing.py
+# Tiempo y memoria pico de cada etapa del análisis, con registro estructurado (JSON por línea)
+import json
+import logging
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+import pandas as pd
+
+logger = logging.getLogger("pcr.etapas")
+
+
+def configure_logging():
+    """Envía los registros de etapas a stderr, una línea JSON por etapa.
+
+    La llaman los programas (app, lotes), no los módulos al importarse;
+    puede llamarse varias veces, y en los procesos del pool como `initializer`.
+    """
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+# Etapas en curso con memoria activa: tracemalloc sólo se mantiene mientras haya alguna
+_tracing_lock = threading.Lock()
+_tracing_stages = 0
+_tracing_started = False
+
+
+def _start_tracing():
+    global _tracing_stages, _tracing_started
+    with _tracing_lock:
+        if _tracing_stages == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_started = True
+        _tracing_stages += 1
+
+
+def _stop_tracing():
+    global _tracing_stages, _tracing_started
+    with _tracing_lock:
+        _tracing_stages -= 1
+        # Sólo se para si lo arrancamos aquí (no con `python -X tracemalloc`)
+        if _tracing_stages == 0 and _tracing_started:
+            tracemalloc.stop()
+            _tracing_started = False
+
+
+class StageLog:
+    """Registros de (run, etapa, ms, memoria pico) de una sesión o proceso.
+
+    Con `memory=True` tracemalloc se activa sólo mientras dura alguna etapa
+    medida, lo que ralentiza esas etapas; al terminar la última se detiene.
+    La memoria pico es la del proceso durante la etapa, así que con varios
+    runs en paralelo incluye lo que hagan los demás hilos.
+    """
+
+    def __init__(self, memory=True):
+        self.records = []
+        self.memory = memory
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, run=""):
+        if self.memory:
+            _start_tracing()
+            tracemalloc.reset_peak()
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = {"run": run, "etapa": name, "ms": round((time.perf_counter() - t0) * 1000, 2)}
+            if self.memory:
+                record["pico_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+                _stop_tracing()
+            with self._lock:
+                self.records.append(record)
+            logger.info(json.dumps(record, ensure_ascii=False))
+
+    def table(self):
+        return pd.DataFrame(self.records, columns=["run", "etapa", "ms", "pico_mb"])
+
+
+def stage(log, name, run=""):
+    """Contexto de `log.stage(...)`, o uno vacío si no hay instrumentación."""
+    return log.stage(name, run) if log is not None else nullcontext()
@@ -0,0 +1,211 @@
+# pcr_watch.py
+# Vigila una carpeta y procesa cada export nuevo del equipo en cuanto termina de copiarse.
+#
+#   python pcr_watch.py /ruta/exports --workers 4 --calibraciones calibraciones.sqlite
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from pcr_batch import EXTENSIONES, process_runs
+
+# Segundos que el archivo debe seguir igual (tamaño y fecha) para darlo por completo
+SETTLE_SECONDS = 2.0
+# Intervalo entre exploraciones de la carpeta (sin inotify es el único aviso)
+POLL_SECONDS = 1.0
+
+
+def is_export(path):
+    """Archivo con extensión de export que no es un resultado ni un temporal."""
+    name = path.name
+    return (
+        path.suffix.lower() in EXTENSIONES
+        and not path.stem.endswith("_resumen")
+        and name != "resumen_combinado.xlsx"
+        and not name.startswith(("~$", "."))
+    )
+
+
+def result_path(path):
+    return path.with_name(f"{path.stem}_resumen.xlsx")
+
+
+def is_pending(path):
+    """Export sin libro de resultados, o modificado después de generarlo.
+
+    Un export que desaparece mientras se mira (borrado o renombrado) no está pendiente.
+    """
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        return False
+    try:
+        return result_path(path).stat().st_mtime < mtime
+    except FileNotFoundError:
+        return True
+
+
+class FolderWatcher:
+    """Procesa en un pool de procesos los exports nuevos o modificados de `directory`.
+
+    Un export se procesa cuando el sistema avisa de que se ha cerrado tras
+    escribirlo (inotify, con `watchdog` instalado) o, si no, cuando su tamaño
+    y fecha no cambian durante `SETTLE_SECONDS`. El libro `<run>_resumen.xlsx`
+    se escribe junto al export, así que al reiniciar sólo se procesa lo
+    pendiente.
+    """
+
+    def __init__(self, directory, workers=None, **options):
+        self.directory = Path(directory)
+        self.options = options
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+        self._wake = threading.Event()
+        self._closed = set()     # exports cerrados según inotify
+        self._stat = {}          # export -> ((tamaño, fecha), momento en que se vio así)
+        self._running = set()
+        self._failed = {}        # export -> fecha del archivo que falló (no se reintenta sin cambios)
+        self._lock = threading.Lock()
+
+    def _start_observer(self):
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            return None
+
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.event_type == "closed" and not event.is_directory:
+                    with watcher._lock:
+                        watcher._closed.add(Path(event.src_path))
+                watcher._wake.set()
+
+        observer = Observer()
+        observer.schedule(Handler(), str(self.directory), recursive=False)
+        observer.start()
+        return observer
+
+    def _pending(self, path):
+        if not is_pending(path):
+            return False
+        try:
+            return self._failed.get(path) != path.stat().st_mtime
+        except FileNotFoundError:
+            return False
+
+    def _ready(self, path, now):
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            self._stat.pop(path, None)
+            return False
+        with self._lock:
+            if path in self._closed:
+                self._closed.discard(path)
+                return True
+        key = (st.st_size, st.st_mtime)
+        previous = self._stat.get(path)
+        if previous is None or previous[0] != key:
+            self._stat[path] = (key, now)
+            return False
+        return st.st_size > 0 and now - previous[1] >= SETTLE_SECONDS
+
+    def scan(self):
+        """Lanza los exports pendientes que ya están completos; devuelve cuántos."""
+        now = time.monotonic()
+        ready = []
+        for path in sorted(self.directory.iterdir()):
+            if not path.is_file() or not is_export(path) or path in self._running:
+                continue
+            if not self._pending(path) or not self._ready(path, now):
+                continue
+            self._stat.pop(path, None)
+            with self._lock:
+                self._running.add(path)
+            ready.append(path)
+        if not ready:
+            return 0
+        # Los exports que llegan juntos se procesan como un lote: las rectas reutilizadas
+        # no dependen de cuál termine antes
+        futures = process_runs(
+            self.pool, ready, self.directory, self.options.get("multiplicador", 100),
+            self.options.get("calibration_db"), self.options.get("lot", ""),
+            self.options.get("archive_dir"), self.options.get("own_curve", False),
+        )
+        for path, future in futures.items():
+            future.add_done_callback(lambda fut, path=path: self._done(path, fut))
+        return len(ready)
+
+    def _done(self, path, future):
+        try:
+            _, _, avisos = future.result()
+        except Exception as exc:
+            print(f"ERROR {path.name}: {exc}", file=sys.stderr)
+            try:
+                self._failed[path] = path.stat().st_mtime
+            except FileNotFoundError:
+                pass
+        else:
+            for aviso in avisos:
+                print(f"AVISO {path.name}: {aviso}", file=sys.stderr)
+            print(f"OK {path.name} -> {result_path(path).name}")
+        with self._lock:
+            self._running.discard(path)
+        self._wake.set()
+
+    def run(self, once=False):
+        """Vigila la carpeta hasta Ctrl+C; con `once`, procesa lo pendiente y termina."""
+        observer = None if once else self._start_observer()
+        if not once:
+            modo = "inotify" if observer else f"sondeo cada {POLL_SECONDS:g} s"
+            print(f"Vigilando {self.directory} ({modo})")
+        try:
+            while True:
+                self.scan()
+                if once and not self._running and not any(
+                    is_export(p) and self._pending(p) for p in self.directory.iterdir() if p.is_file()
+                ):
+                    break
+                self._wake.wait(POLL_SECONDS)
+                self._wake.clear()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+            self.pool.shutdown(wait=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Procesa automáticamente los exports que llegan a una carpeta.")
+    parser.add_argument("directory", help="Carpeta donde el equipo deja los exports")
+    parser.add_argument("-m", "--multiplicador", type=int, choices=[100, 10000], default=100)
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+                        help="Procesos en paralelo (por defecto, nº de CPUs)")
+    parser.add_argument("--calibraciones", help="Biblioteca de calibraciones (SQLite) a usar y actualizar")
+    parser.add_argument("--lote", default="", help="Lote de calibrador de los runs")
+    parser.add_argument("--archivo", help="Archivo Parquet de resultados (por defecto, archivo_resultados/ en la carpeta)")
+    parser.add_argument("--recta-propia", action="store_true",
+                        help="Recalcular la Quantity de cada pocillo con las rectas del run")
+    parser.add_argument("--una-vez", action="store_true", help="Procesar lo pendiente y salir")
+    args = parser.parse_args(argv)
+
+    directory = Path(args.directory)
+    if not directory.is_dir():
+        parser.error(f"no existe la carpeta {directory}")
+    FolderWatcher(
+        directory, args.workers,
+        multiplicador=args.multiplicador, calibration_db=args.calibraciones, lot=args.lote,
+        archive_dir=args.archivo or str(directory / "archivo_resultados"), own_curve=args.recta_propia,
+    ).run(once=args.una_vez)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())